@@ -4,5 +4,8 @@ from .entity import Entity
 from .individual import Individual
 from .cell import Cell
 from .world import World
+from .population import Population, PopulationVariable
+from .registry import EntityRegistry
+from .streams import RandomStreams
 
 from .component import Component
@@ -1,6 +1,4 @@
-import os
-import sys
-import pandas as pd
+import numpy as np
 
 from . import Entity
 
@@ -11,27 +9,38 @@ class Cell(Entity):
     and parameters.
     """
 
-    # property to get output variables
     @property
-    def output_table(self):
-        variables = self.get_defined_outputs()
-
-        if not variables:
-            return pd.DataFrame()
-        else:
-            df = super().output_table
-
-            df.insert(1, "cell", [self.grid.cell.item()] * len(variables))
-            df.insert(2, "lon", [self.grid.cell.lon.item()] * len(variables))
-            df.insert(3, "lat", [self.grid.cell.lat.item()] * len(variables))
-
-            if hasattr(self, "country"):
-                df.insert(4, "country", [self.country.item()] * len(variables))
-            if hasattr(self, "area"):
-                df.insert(
-                    5,
-                    "area [km2]",
-                    [round(self.area.item() * 1e-6, 4)] * len(variables),
-                )
-
-            return df
+    def cell_id(self):
+        """Return the LPJmL cell id of the cell."""
+        if not hasattr(self, "_cell_id"):
+            self._cell_id = self.grid.cell.item()
+        return self._cell_id
+
+    @classmethod
+    def population_output_columns(cls, cells):
+        return location_columns(cells)
+
+
+def location_columns(cells):
+    """Return the location columns (cell, lon, lat, country, area) of the
+    given cells, gathered from the world arrays at once.
+    """
+    world = cells[0].world
+    cell_ids = np.array([cell.cell_id for cell in cells])
+    icells = world.grid.get_index("cell").get_indexer(cell_ids)
+
+    columns = {
+        "cell": cell_ids,
+        "lon": world.grid.lon.values[icells],
+        "lat": world.grid.lat.values[icells],
+    }
+    if hasattr(world, "country"):
+        columns["country"] = world.country.isel(cell=icells).values.ravel()
+    if hasattr(world, "area"):
+        columns["area [km2]"] = np.array(
+            [
+                round(area * 1e-6, 4)
+                for area in world.area.isel(cell=icells).values.ravel()
+            ]
+        )
+    return columns
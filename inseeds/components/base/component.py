@@ -1,84 +1,282 @@
 import os
 import sys
-import pandas as pd
+import atexit
 import pyarrow as pa
 import pyarrow.parquet as pq
 
+from .writer import OutputWriter
+from .parquet import ParquetWriter, truncate_parquet
+from .netcdf import NetCDFWriter, truncate_netcdf
+from .csv import CSVWriter, CSV_COMPRESSIONS, truncate_csv
+
 
 class Component:
     """Model mixin class."""
 
     def __init__(self, **kwargs):
         """Initialize the model mixin."""
-        pass
+        # parquet writer kept for the whole simulation
+        self._parquet_writer = None
+
+        # netcdf writer kept open for the whole simulation
+        self._netcdf_writer = None
+
+        # csv writer kept open for the whole simulation
+        self._csv_writer = None
+
+        # background thread writing the output tables
+        self._output_writer = None
 
     @property
-    def output_table(self):
-        # get all world outputs
-        df = self.world.output_table
+    def entity_types(self):
+        """Return all entities of the model grouped by entity type."""
+        entities = [self.world]
 
-        # get all cell outputs
-        if hasattr(self.world, "cells"):
-            df = pd.concat(
-                [df] + [cell.output_table for cell in self.world.cells]
-            )
+        # get all cell outputs, in the stable order of the registry if any
+        if hasattr(self.world, "registry"):
+            entities.extend(self.world.registry.entities("Cell"))
+        elif hasattr(self.world, "cells"):
+            entities.extend(self.world.cells)
 
         # get all farmer outputs
         if hasattr(self.world, "farmers"):
-            df = pd.concat(
-                [df] + [farmer.output_table for farmer in self.world.farmers]
-            )
+            entities.extend(self.world.farmers)
+
+        # group entities by entity type to collect their outputs at once
+        entity_types = {}
+        for entity in entities:
+            entity_types.setdefault(entity.__class__, []).append(entity)
 
-        return df
+        return entity_types
 
-    def write_output_table(self, init=False, file_format="parquet"):
+    def get_output_tables(self, layout="long"):
+        """Return the output of each entity type as one Arrow table."""
+        tables = [
+            entity_type.population_output_table(population, layout=layout)
+            for entity_type, population in self.entity_types.items()
+        ]
+        return [table for table in tables if table is not None]
+
+    def get_output_table(self, layout="long"):
+        """Return the output of all entities as one Arrow table."""
+        tables = self.get_output_tables(layout=layout)
+        if not tables:
+            return pa.table({})
+        return pa.concat_tables(tables, promote_options="default")
+
+    @property
+    def output_table(self):
+        return self.get_output_table().to_pandas()
+
+    def get_entities_table(self):
+        """Return the static information of all entities with outputs as
+        one Arrow table (entities table of the normalized layout)."""
+        tables = [
+            entity_type.population_entities_table(population)
+            for entity_type, population in self.entity_types.items()
+        ]
+        tables = [table for table in tables if table is not None]
+        if not tables:
+            return pa.table({})
+        return pa.concat_tables(tables, promote_options="default")
+
+    def get_output_file_name(self, file_format, name="inseeds_data"):
+        """Return the file name of the output file `name`."""
+        return f"{self.config.sim_path}/output/{self.config.sim_name}/{name}.{file_format}"  # noqa
+
+    def get_csv_file_name(self, compression=None, name="inseeds_data"):
+        """Return the file name of the (compressed) CSV output file `name`."""
+        if compression is None:
+            return self.get_output_file_name("csv", name)
+        return self.get_output_file_name(
+            f"csv.{CSV_COMPRESSIONS.get(compression, compression)}", name
+        )
+
+    def write_output_table(
+        self,
+        init=False,
+        file_format="parquet",
+        layout="long",
+        background=False,
+        max_queue_size=2,
+        compression=None,
+        flush_interval=1,
+    ):
+        """Write the output table of the current year.
+
+        The table is always collected in the calling thread. With
+        `background` it is then written by an `OutputWriter` thread, so
+        the model can continue (e.g. exchange data with LPJmL) while the
+        output is serialized and written to disk. The queued tables are
+        written by `close_output_table`, which is also called at exit.
+
+        The output file is (over)written with `init` at the start of the
+        coupling, for the normalized layout together with the static
+        entities table. The netcdf file format writes the
+        variables onto the LPJmL grid, independent of the layout.
+        `compression` and `flush_interval` apply to the csv file format, see
+        `write_output_csv`.
+        """
         if hasattr(sys, "_called_from_test"):
             return
-        if file_format == "parquet":
-            self.write_output_parquet(self.output_table, init)
-        elif file_format == "csv":
-            self.write_output_csv(self.output_table, init)
-        else:
+        if file_format not in ["parquet", "csv", "netcdf"]:
             raise ValueError(f"Output file format {file_format} not supported")
 
-    def write_output_csv(self, df, init=False):
-        """Write output data"""
-        mode = (
-            "w"
-            if (
-                self.lpjml.sim_year == self.config.start_coupling and init
-            )  # noqa
-            else "a"
-        )
+        if layout == "normalized" and init:
+            self.write_entities_table(file_format, compression)
+
+        # overwrite only at the start of the coupling, evaluated here as the
+        #   writer thread may run when sim_year is already updated
+        init = self.lpjml.sim_year == self.config.start_coupling and init
 
-        # define the file name and header row
-        file_name = f"{self.config.sim_path}/output/{self.config.sim_name}/inseeds_data.csv"  # noqa
+        if file_format == "netcdf":
+            table = self.get_output_tables(layout="wide")
+        else:
+            table = self.get_output_table(layout=layout)
 
-        if not os.path.isfile(file_name) or mode == "w":
-            header = True
+        if background:
+            if self._output_writer is None:
+                self._output_writer = OutputWriter(
+                    self._write_output, max_queue_size=max_queue_size
+                )
+                # write the queued tables and close the output file also if
+                #   the simulation is stopped before it is closed
+                atexit.register(self.close_output_table)
+            self._output_writer.put(
+                table,
+                init,
+                file_format,
+                self.lpjml.sim_year,
+                compression,
+                flush_interval,
+            )
         else:
-            header = False
+            self._write_output(
+                table,
+                init,
+                file_format,
+                self.lpjml.sim_year,
+                compression,
+                flush_interval,
+            )
+
+    def _write_output(
+        self, table, init, file_format, year, compression, flush_interval
+    ):
+        if file_format == "parquet":
+            self.write_output_parquet(table, init)
+        elif file_format == "csv":
+            self.write_output_csv(table, init, compression, flush_interval)
+        elif file_format == "netcdf":
+            self.write_output_netcdf(table, year, init)
+
+    def write_output_csv(
+        self, table, init=False, compression=None, flush_interval=1
+    ):
+        """Write output data to CSV file
 
-        df.to_csv(file_name, mode=mode, header=header, index=False)
+        The file is kept open with a `CSVWriter` for the whole simulation
+        and each call appends the encoded rows of the table, the file is
+        flushed every `flush_interval` calls. With `compression` ("gzip" or
+        "zstd") the file is written compressed as inseeds_data.csv.gz or
+        inseeds_data.csv.zst. An existing file is overwritten with `init`.
+        """
+        if self._csv_writer is None or init:
+            self._close_output_file()
+            self._csv_writer = CSVWriter(
+                self.get_csv_file_name(compression),
+                table.schema,
+                init=init,
+                compression=compression,
+                flush_interval=flush_interval,
+            )
+        self._csv_writer.write(table)
 
-    def write_output_parquet(self, df, init=False):
-        """Write output data to Parquet file"""
-        file_name = f"{self.config.sim_path}/output/{self.config.sim_name}/inseeds_data.parquet"  # noqa
+    def write_output_parquet(self, table, init=False):
+        """Write output data to Parquet dataset
 
-        # Append mode: write new data without rewriting the file.
-        if not os.path.isfile(file_name) or (
-            self.lpjml.sim_year == self.config.start_coupling and init
-        ):
-            df.to_parquet(file_name, engine="pyarrow", index=False)
-        else:
-            # Read the existing data
-            existing_data = pd.read_parquet(file_name)
+        The output is written with a `ParquetWriter` to the directory
+        inseeds_data.parquet with one file per year, so the cost per year
+        does not grow with the number of years already written and the
+        years written so far are readable at any time (e.g. after the
+        simulation was killed). Years are added to an existing dataset,
+        which is overwritten with `init`.
+        """
+        if self._parquet_writer is None or init:
+            self._close_output_file()
+            self._parquet_writer = ParquetWriter(
+                self.get_output_file_name("parquet"), table.schema, init=init
+            )
+        self._parquet_writer.write(table)
 
-            # Concatenate the existing data with the new data
-            combined_data = pd.concat([existing_data, df], ignore_index=True)
+    def write_output_netcdf(self, tables, year, init=False):
+        """Write output data of one year onto the LPJmL grid (lat, lon) of
+        a NetCDF file, see `NetCDFWriter`. The file is kept open for the
+        whole simulation and each year is appended along the time dimension.
+        An existing file is overwritten with `init`.
+        """
+        if self._netcdf_writer is None or init:
+            self._close_output_file()
+            self._netcdf_writer = NetCDFWriter(
+                self.get_output_file_name("nc"), self.world.grid, init=init
+            )
+        self._netcdf_writer.write(year, tables)
+
+    def write_entities_table(self, file_format="parquet", compression=None):
+        """Write the static entities table of the normalized layout."""
+        table = self.get_entities_table()
+        if file_format == "parquet":
+            pq.write_table(
+                table, self.get_output_file_name("parquet", "inseeds_entities")
+            )
+        elif file_format == "csv":
+            csv_writer = CSVWriter(
+                self.get_csv_file_name(compression, "inseeds_entities"),
+                table.schema,
+                compression=compression,
+            )
+            csv_writer.write(table)
+            csv_writer.close()
+
+    def truncate_output(self, year, file_format="parquet", compression=None):
+        """Remove the output of `year` and later years from the output file,
+        e.g. to resume a simulation in `year` without writing a year twice.
+        """
+        self.close_output_table()
+        if file_format == "parquet":
+            truncate_parquet(self.get_output_file_name("parquet"), year)
+        elif file_format == "csv":
+            file_name = self.get_csv_file_name(compression)
+            if os.path.isfile(file_name):
+                truncate_csv(file_name, year, compression)
+        elif file_format == "netcdf":
+            file_name = self.get_output_file_name("nc")
+            if os.path.isfile(file_name):
+                truncate_netcdf(file_name, year)
+
+    def close_output_table(self):
+        """Finish writing of all output tables and close the output file."""
+        if self._output_writer is not None:
+            output_writer, self._output_writer = self._output_writer, None
+            atexit.unregister(self.close_output_table)
+            try:
+                output_writer.close()
+            finally:
+                self._close_output_file()
+        else:
+            self._close_output_file()
 
-            # Write the combined data back
-            combined_data.to_parquet(file_name, engine="pyarrow", index=False)
+    def _close_output_file(self):
+        """Close the output file writers (if opened)"""
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+        if self._netcdf_writer is not None:
+            self._netcdf_writer.close()
+            self._netcdf_writer = None
+        if self._csv_writer is not None:
+            self._csv_writer.close()
+            self._csv_writer = None
 
     def update(self, t):
         """Update the model."""
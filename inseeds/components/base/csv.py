@@ -0,0 +1,183 @@
+"""Streaming output writing to CSV."""
+
+import os
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+
+# file name extensions of the supported compressions
+CSV_COMPRESSIONS = {"gzip": "gz", "zstd": "zst"}
+
+
+def _text(value):
+    """Return a text scalar matching the (large string) encoded columns."""
+    return pa.scalar(value, pa.large_string())
+
+
+def encode_csv_column(column):
+    """Encode a column to the text written by `pandas.DataFrame.to_csv`.
+
+    Floats are written as the shortest text of their type as by NumPy
+    (as pandas does, e.g. 1e-05, 1.2345679e+08 for float32), NaN and nulls
+    as empty field, booleans as True/False and strings are only quoted if
+    needed (minimal quoting).
+    """
+    if pa.types.is_dictionary(column.type):
+        column = column.cast(column.type.value_type)
+
+    if pa.types.is_floating(column.type):
+        if isinstance(column, pa.ChunkedArray):
+            return pa.chunked_array(
+                [encode_csv_column(chunk) for chunk in column.chunks],
+                pa.large_string(),
+            )
+        # nulls are converted to NaN
+        values = column.to_numpy(zero_copy_only=False)
+        return pa.array(
+            values.astype(str), pa.large_string(), mask=np.isnan(values)
+        )
+    elif pa.types.is_boolean(column.type):
+        return pc.if_else(column, "True", "False").cast(pa.large_string())
+
+    text = column.cast(pa.large_string())
+    if pa.types.is_string(column.type) or pa.types.is_large_string(
+        column.type
+    ):
+        quoted = pc.binary_join_element_wise(
+            _text('"'),
+            pc.replace_substring(text, '"', '""'),
+            _text('"'),
+            _text(""),
+        )
+        return pc.if_else(
+            pc.match_substring_regex(text, '[,"\r\n]'), quoted, text
+        )
+    return text
+
+
+def encode_csv_lines(table):
+    """Encode the rows of a table to CSV lines (including the line end)."""
+    columns = [encode_csv_column(column) for column in table.columns]
+    return pc.binary_join_element_wise(
+        pc.binary_join_element_wise(
+            *columns, _text(","), null_handling="replace"
+        ),
+        _text("\n"),
+        _text(""),
+    )
+
+
+class CSVWriter:
+    """Write output tables to a CSV file that is kept open.
+
+    The rows of each table are encoded with Arrow compute functions (see
+    `encode_csv_column`) to the same text as written by
+    `pandas.DataFrame.to_csv` and the encoded chunks are written at once
+    into a buffered stream, optionally compressed (gzip or zstd). The
+    stream is flushed to disk every `flush_interval` tables and when the
+    writer is closed. Every call of `write` appends the rows of one table,
+    the header is written once at the start of a new file.
+
+    Parameters
+    ----------
+    file_name : str
+        Path of the CSV file.
+    schema : pyarrow.Schema
+        Schema of the written tables, other tables are cast to it.
+    init : bool
+        Overwrite an existing file, else append to it.
+    compression : str, optional
+        Compression of the file, "gzip" or "zstd", default none.
+    flush_interval : int
+        Number of tables after which the file is flushed, 0 flushes only
+        when the writer is closed.
+    buffer_size : int
+        Size of the write buffer in bytes.
+    """
+
+    def __init__(
+        self,
+        file_name,
+        schema,
+        init=True,
+        compression=None,
+        flush_interval=1,
+        buffer_size=1 << 20,
+    ):
+        if compression is not None and compression not in CSV_COMPRESSIONS:
+            raise ValueError(f"CSV compression {compression} not supported")
+
+        append = (
+            not init
+            and os.path.isfile(file_name)
+            and os.path.getsize(file_name) > 0
+        )
+        # compressed data is appended as new gzip member/zstd frame which
+        #   is read as part of the same file
+        self._stream = pa.BufferedOutputStream(
+            pa.OSFile(file_name, "ab" if append else "wb"), buffer_size
+        )
+        if compression is not None:
+            self._stream = pa.CompressedOutputStream(self._stream, compression)
+
+        self.schema = schema
+        if not append:
+            header = encode_csv_column(pa.array(schema.names, pa.string()))
+            self._stream.write(
+                (",".join(header.to_pylist()) + "\n").encode("utf-8")
+            )
+
+        self.flush_interval = flush_interval
+        self._unflushed = 0
+
+    def write(self, table):
+        """Append the rows of a table."""
+        if not table.schema.equals(self.schema):
+            table = table.cast(self.schema)
+
+        for lines in encode_csv_lines(table).chunks:
+            if len(lines) == 0:
+                continue
+            # the encoded lines are contiguous in the data buffer
+            _, offsets, data = lines.buffers()
+            offsets = np.frombuffer(offsets, dtype=np.int64)
+            start = offsets[lines.offset]
+            end = offsets[lines.offset + len(lines)]
+            self._stream.write(data[start:end])
+
+        self._unflushed += 1
+        if self.flush_interval and self._unflushed >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Flush the written rows to disk."""
+        self._stream.flush()
+        self._unflushed = 0
+
+    def close(self):
+        """Flush and close the file."""
+        self._stream.close()
+
+
+def truncate_csv(file_name, year, compression=None):
+    """Remove the rows of `year` and later years from a CSV output file, the
+    remaining rows are written again with the same text."""
+    with pa.input_stream(file_name, compression=compression) as stream:
+        names = pa_csv.open_csv(stream).schema.names
+
+    # read all fields as text to write them unchanged
+    with pa.input_stream(file_name, compression=compression) as stream:
+        table = pa_csv.read_csv(
+            stream,
+            convert_options=pa_csv.ConvertOptions(
+                column_types={name: pa.large_string() for name in names},
+                strings_can_be_null=False,
+                quoted_strings_can_be_null=False,
+            ),
+        )
+    table = table.filter(pc.less(table["year"].cast(pa.int64()), year))
+
+    writer = CSVWriter(file_name, table.schema, compression=compression)
+    writer.write(table)
+    writer.close()
@@ -1,5 +1,11 @@
+import numpy as np
 import pandas as pd
+import pyarrow as pa
 from . import Output
+from .output import OutputSchema
+
+# column types of the wide output layout by variable datatype
+WIDE_OUTPUT_TYPES = {bool: pa.bool_(), int: pa.int32(), float: pa.float32()}
 
 
 class Entity:
@@ -10,57 +16,248 @@ class Entity:
 
     output_variables = Output()
 
-    def __init__(self, model=None):
+    # output variables that do not change during a simulation, written only
+    #   once to the entities table of the normalized output layout
+    static_output_variables = []
+
+    def __init__(self, model=None, **kwargs):
         """Initialize an instance of World."""
+        # pass the other arguments on to the entity classes of the model
+        #   composed after the inseeds ones (e.g. of the LPJmL component)
+        super().__init__(**kwargs)
         self.model = model
 
+    @property
+    def entity_id(self):
+        """Return the unique id of the entity, the id it was written to the
+        output with if resumed from a checkpoint."""
+        return self.__dict__.get("_entity_id", self._uid)
+
+    @entity_id.setter
+    def entity_id(self, entity_id):
+        self._entity_id = entity_id
+
     @property
     def output_table(self):
-        variables = self.get_defined_outputs()
-        if not variables:
+        table = self.__class__.population_output_table([self])
+        if table is None:
             return pd.DataFrame()
         else:
-            return pd.DataFrame(
-                {
-                    "year": [self.model.lpjml.sim_year] * len(variables),
-                    "entity": [self.__class__.__name__] * len(variables),
-                    "variable": [
-                        getattr(
-                            getattr(
-                                self.__class__.output_variables, var, None
-                            ),
-                            "name",
-                            None,
-                        )
-                        for var in variables
-                    ],
-                    "value": [getattr(self, var, None) for var in variables],
-                    "unit": [
-                        getattr(
-                            getattr(
-                                getattr(
-                                    self.__class__.output_variables, var, None
-                                ),
-                                "unit",
-                                None,
-                            ),
-                            "symbol",
-                            None,
-                        )
-                        for var in variables
-                    ],
-                }
+            return table.to_pandas()
+
+    @classmethod
+    def population_output_table(cls, entities, layout="long"):
+        """Return the output of all given entities of this entity type as
+        one Arrow table. Each variable is collected from all entities into
+        one array instead of building a table per entity.
+
+        The long layout holds one row per entity and variable, the wide
+        layout one row per entity with a typed column per variable. The
+        normalized layout holds only year, entity id, variable and value of
+        the variables that are not static, see `population_entities_table`.
+        """
+        entities = list(entities)
+        if not entities:
+            return None
+
+        schema = cls.get_output_schema(entities[0].model)
+        ivars = [
+            ivar
+            for ivar, var in enumerate(schema.variables)
+            if layout != "normalized" or var not in cls.static_output_variables
+        ]
+        if not ivars:
+            return None
+
+        # collect the values of each variable from all entities
+        values = schema.values(entities, ivars)
+
+        if layout == "long":
+            return cls._long_output_table(entities, schema, ivars, values)
+        elif layout == "wide":
+            return cls._wide_output_table(entities, schema, ivars, values)
+        elif layout == "normalized":
+            return cls._normalized_output_table(
+                entities, schema, ivars, values
             )
+        else:
+            raise ValueError(f"Output layout {layout} not supported")
 
-    def get_defined_outputs(self):
-        return [
-            var
-            for var in self.__class__.output_variables.names
-            if var
-            in self.model.config.coupled_config.output.to_dict()[
-                self.__class__.__name__.lower()
-            ]
+    @classmethod
+    def _long_output_table(cls, entities, schema, ivars, values):
+        """Long format table, entity-major with one row per (entity,
+        variable)."""
+        n_entities, n_variables = values.shape
+
+        names = np.array([schema.names[ivar] for ivar in ivars], dtype=object)
+        units = np.array([schema.units[ivar] for ivar in ivars], dtype=object)
+
+        columns = {
+            "year": np.full(
+                n_entities * n_variables, entities[0].model.lpjml.sim_year
+            )
+        }
+        for name, column in cls.population_output_columns(entities).items():
+            columns[name] = np.repeat(column, n_variables)
+        columns["entity"] = np.full(n_entities * n_variables, cls.__name__)
+        columns["variable"] = np.tile(names, n_entities)
+        columns["value"] = values.ravel()
+        columns["unit"] = pa.array(np.tile(units, n_entities), pa.string())
+
+        return pa.table(columns)
+
+    @classmethod
+    def _wide_output_table(cls, entities, schema, ivars, values):
+        """Wide format table with one row per entity and one typed column
+        per variable. Variable names and units are stored as field metadata,
+        repeated strings are dictionary encoded.
+        """
+        n_entities = len(entities)
+
+        fields = [pa.field("year", pa.int64())]
+        columns = [
+            pa.array(np.full(n_entities, entities[0].model.lpjml.sim_year))
         ]
+        for name, column in cls.population_output_columns(entities).items():
+            column = _dictionary_encode_strings(pa.array(column))
+            fields.append(pa.field(name, column.type))
+            columns.append(column)
+
+        column = pa.array(np.full(n_entities, cls.__name__))
+        column = column.dictionary_encode()
+        fields.append(pa.field("entity", column.type))
+        columns.append(column)
+
+        for icol, ivar in enumerate(ivars):
+            field, column = _typed_output_column(schema, ivar, values[:, icol])
+            fields.append(field)
+            columns.append(column)
+
+        return pa.Table.from_arrays(columns, schema=pa.schema(fields))
+
+    @classmethod
+    def _normalized_output_table(cls, entities, schema, ivars, values):
+        """Normalized format table with one row per (entity, variable)
+        holding only year, entity id, variable and value.
+        """
+        n_entities, n_variables = values.shape
+
+        entity_ids = np.array([entity.entity_id for entity in entities])
+        names = pa.array([schema.names[ivar] for ivar in ivars], pa.string())
+
+        return pa.table(
+            {
+                "year": np.full(
+                    n_entities * n_variables,
+                    entities[0].model.lpjml.sim_year,
+                ),
+                "entity_id": np.repeat(entity_ids, n_variables),
+                "variable": pa.DictionaryArray.from_arrays(
+                    np.tile(
+                        np.arange(n_variables, dtype=np.int32), n_entities
+                    ),
+                    names,
+                ),
+                "value": values.ravel(),
+            }
+        )
+
+    @classmethod
+    def population_entities_table(cls, entities):
+        """Return the static information (entity id, location and static
+        output variables) of all given entities of this entity type as one
+        Arrow table. Written once for the normalized output layout.
+        """
+        entities = list(entities)
+        if not entities:
+            return None
+
+        schema = cls.get_output_schema(entities[0].model)
+        if not schema.variables:
+            return None
+
+        n_entities = len(entities)
+
+        fields = [pa.field("entity_id", pa.int64())]
+        columns = [
+            pa.array(
+                [entity.entity_id for entity in entities], type=pa.int64()
+            )
+        ]
+
+        column = pa.array(np.full(n_entities, cls.__name__))
+        column = column.dictionary_encode()
+        fields.append(pa.field("entity", column.type))
+        columns.append(column)
+
+        for name, column in cls.population_output_columns(entities).items():
+            column = _dictionary_encode_strings(pa.array(column))
+            fields.append(pa.field(name, column.type))
+            columns.append(column)
+
+        ivars = [
+            ivar
+            for ivar, var in enumerate(schema.variables)
+            if var in cls.static_output_variables
+        ]
+        values = schema.values(entities, ivars)
+        for icol, ivar in enumerate(ivars):
+            field, column = _typed_output_column(schema, ivar, values[:, icol])
+            fields.append(field)
+            columns.append(column)
+
+        return pa.Table.from_arrays(columns, schema=pa.schema(fields))
+
+    @classmethod
+    def get_output_schema(cls, model):
+        """Return the compiled output schema of the entity type. It is built
+        once and only rebuilt if the outputs defined in the configuration
+        change.
+        """
+        defined_outputs = ()
+        if cls.output_variables.names:
+            defined_outputs = tuple(
+                getattr(
+                    model.config.coupled_config.output,
+                    cls.__name__.lower(),
+                    (),
+                )
+            )
+        # schema of this class only, not inherited from a parent class
+        schema = cls.__dict__.get("_output_schema")
+        if schema is None or schema.defined_outputs != defined_outputs:
+            schema = OutputSchema(cls.output_variables, defined_outputs)
+            cls._output_schema = schema
+        return schema
+
+    @classmethod
+    def population_output_columns(cls, entities):
+        """Return additional (e.g. location) output columns with one value
+        per entity."""
+        return {}
+
+    def get_defined_outputs(self):
+        return self.__class__.get_output_schema(self.model).variables
 
     def update(self, t):
         pass
+
+
+def _typed_output_column(schema, ivar, values):
+    """Return field and column of an output variable typed by its datatype
+    and with its name and unit as field metadata."""
+    column = pa.array(values, mask=np.isnan(values)).cast(
+        WIDE_OUTPUT_TYPES.get(schema.datatypes[ivar], pa.float32())
+    )
+    metadata = {"variable": schema.variables[ivar]}
+    if schema.units[ivar]:
+        metadata["unit"] = schema.units[ivar]
+    field = pa.field(schema.names[ivar], column.type, metadata=metadata)
+    return field, column
+
+
+def _dictionary_encode_strings(column):
+    """Dictionary encode string columns."""
+    if pa.types.is_string(column.type):
+        return column.dictionary_encode()
+    return column
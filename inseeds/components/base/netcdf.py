@@ -0,0 +1,199 @@
+"""Gridded output writing to NetCDF."""
+
+import os
+import numpy as np
+import netCDF4
+import pyarrow as pa
+
+# netCDF types of the (wide layout) output columns
+NETCDF_TYPES = {
+    pa.bool_(): ("i1", -1),
+    pa.int32(): ("i4", -999999),
+    pa.float32(): ("f4", np.nan),
+}
+
+
+class NetCDFWriter:
+    """Write output variables of entities onto the LPJmL lat/lon grid.
+
+    Each output variable of an entity type is written as a variable
+    `<entity>_<variable>` with the dimensions (time, lat, lon) to a NetCDF4
+    file, chunked by year. Every call of `write` appends one year along the
+    unlimited time dimension, so the file can be opened lazily, e.g. with
+    `xarray.open_dataset`, without any reshaping.
+    It is assumed that each cell holds at most one entity of a type. The
+    variables of a single entity without cell location (e.g. the world)
+    are written as time series with the dimension (time), entity types of
+    several entities without cell location are skipped.
+
+    Parameters
+    ----------
+    file_name : str
+        Path of the NetCDF file.
+    grid : pycoupler.LPJmLData
+        Grid of the LPJmL model (lon, lat per cell) with the `cellsize`
+        attribute.
+    init : bool
+        Overwrite an existing file, else append to it.
+    """
+
+    def __init__(self, file_name, grid, init=True):
+        cellsize = grid.attrs.get("cellsize", 0.5)
+        lon = grid.lon.values
+        lat = grid.lat.values
+
+        # regular axes covering the extent of the grid
+        self.lon = np.round(
+            np.arange(lon.min(), lon.max() + cellsize / 2, cellsize), 6
+        )
+        self.lat = np.round(
+            np.arange(lat.min(), lat.max() + cellsize / 2, cellsize), 6
+        )
+        self._lon_min, self._lat_min = lon.min(), lat.min()
+        self._cellsize = cellsize
+
+        if init or not os.path.isfile(file_name):
+            self._dataset = netCDF4.Dataset(file_name, "w")
+            self._init_dimensions()
+        else:
+            self._dataset = netCDF4.Dataset(file_name, "a")
+
+    def _init_dimensions(self):
+        self._dataset.createDimension("time", None)
+        self._dataset.createDimension("lat", len(self.lat))
+        self._dataset.createDimension("lon", len(self.lon))
+
+        time = self._dataset.createVariable("time", "i4", ("time",))
+        time.units = "days since 1970-01-01"
+        time.calendar = "proleptic_gregorian"
+        time.standard_name = "time"
+
+        lat = self._dataset.createVariable("lat", "f8", ("lat",))
+        lat[:] = self.lat
+        lat.units = "degrees_north"
+        lat.standard_name = "latitude"
+
+        lon = self._dataset.createVariable("lon", "f8", ("lon",))
+        lon[:] = self.lon
+        lon.units = "degrees_east"
+        lon.standard_name = "longitude"
+
+    def grid_index(self, lon, lat):
+        """Return the (lat, lon) indices of the given coordinates."""
+        ilat = np.round((lat - self._lat_min) / self._cellsize).astype(int)
+        ilon = np.round((lon - self._lon_min) / self._cellsize).astype(int)
+        return ilat, ilon
+
+    def write(self, year, tables):
+        """Append the output of one year.
+
+        Parameters
+        ----------
+        year : int
+            Year of the output.
+        tables : list of pyarrow.Table
+            Wide layout output table of each entity type (with entity column
+            and lon, lat column if located in cells).
+        """
+        time = self._dataset.variables["time"]
+        itime = len(time)
+        time[itime] = (
+            np.datetime64(f"{year}-12-31") - np.datetime64("1970-01-01")
+        ).astype(int)
+
+        for table in tables:
+            entity = table.column("entity")[0].as_py().lower()
+            gridded = {"lon", "lat"}.issubset(table.column_names)
+            if gridded:
+                ilat, ilon = self.grid_index(
+                    table.column("lon").to_numpy(),
+                    table.column("lat").to_numpy(),
+                )
+            elif table.num_rows != 1:
+                continue
+
+            for field in table.schema:
+                metadata = field.metadata or {}
+                if b"variable" not in metadata:
+                    continue
+                name = f"{entity}_{metadata[b'variable'].decode()}"
+                datatype, fill_value = NETCDF_TYPES[field.type]
+
+                if name not in self._dataset.variables:
+                    if gridded:
+                        dimensions = ("time", "lat", "lon")
+                        chunksizes = (1, len(self.lat), len(self.lon))
+                    else:
+                        dimensions, chunksizes = ("time",), None
+                    variable = self._dataset.createVariable(
+                        name,
+                        datatype,
+                        dimensions,
+                        fill_value=fill_value,
+                        chunksizes=chunksizes,
+                        zlib=True,
+                    )
+                    variable.long_name = field.name
+                    variable.entity = entity
+                    if b"unit" in metadata:
+                        variable.units = metadata[b"unit"].decode()
+
+                column = table.column(field.name)
+                if not gridded:
+                    value = column[0].as_py()
+                    self._dataset.variables[name][itime] = (
+                        fill_value if value is None else value
+                    )
+                    continue
+
+                values = np.full(
+                    (len(self.lat), len(self.lon)),
+                    fill_value,
+                    dtype=datatype,
+                )
+                valid = column.is_valid().to_numpy(zero_copy_only=False)
+                values[ilat[valid], ilon[valid]] = column.drop_null().to_numpy(
+                    zero_copy_only=False
+                )
+                self._dataset.variables[name][itime, :, :] = values
+
+    def close(self):
+        """Close the NetCDF file."""
+        self._dataset.close()
+
+
+def truncate_netcdf(file_name, year):
+    """Remove the time steps of `year` and later years from a NetCDF output
+    file (written by `NetCDFWriter`). The unlimited time dimension can not
+    shrink, so the remaining time steps are copied to a new file."""
+    with netCDF4.Dataset(file_name) as source:
+        days = source.variables["time"][:].astype("timedelta64[D]")
+        years = (np.datetime64("1970-01-01") + days).astype("datetime64[Y]")
+        n_times = int(np.sum(years.astype(int) + 1970 < year))
+        if n_times == len(days):
+            return
+
+        temporary = f"{file_name}.{os.getpid()}.tmp"
+        with netCDF4.Dataset(temporary, "w") as target:
+            for name, dimension in source.dimensions.items():
+                target.createDimension(
+                    name, None if dimension.isunlimited() else len(dimension)
+                )
+            for name, variable in source.variables.items():
+                attributes = variable.__dict__.copy()
+                fill_value = attributes.pop("_FillValue", None)
+                chunking = variable.chunking()
+                copy = target.createVariable(
+                    name,
+                    variable.dtype,
+                    variable.dimensions,
+                    fill_value=fill_value,
+                    chunksizes=None if chunking == "contiguous" else chunking,
+                    zlib=variable.filters().get("zlib", False),
+                )
+                copy.setncatts(attributes)
+                if "time" in variable.dimensions:
+                    copy[:n_times] = variable[:n_times]
+                else:
+                    copy[:] = variable[:]
+    os.replace(temporary, file_name)
@@ -1,5 +1,8 @@
 """Output writing class."""
 
+import operator
+import numpy as np
+
 
 class Output:
     """Model mixin class."""
@@ -12,3 +15,90 @@ class Output:
     def names(self):
         """Return the model variables."""
         return list(self.__dict__.keys())
+
+
+class OutputSchema:
+    """Compiled output schema of an entity type.
+
+    Holds the output variables of an entity type that are defined in the
+    configuration together with their display names, units, datatypes and
+    attribute getters. It is built once per entity type instead of being
+    resolved for every entity and year.
+
+    Parameters
+    ----------
+    output_variables : Output
+        Output variables registry of the entity type.
+    defined_outputs : list
+        Names of the output variables defined in the configuration.
+    """
+
+    def __init__(self, output_variables, defined_outputs):
+        self.defined_outputs = tuple(defined_outputs)
+        self.variables = [
+            var for var in output_variables.names if var in defined_outputs
+        ]
+
+        definitions = [
+            getattr(output_variables, var) for var in self.variables
+        ]
+        self.names = [
+            getattr(definition, "name", None) for definition in definitions
+        ]
+        self.units = [
+            getattr(getattr(definition, "unit", None), "symbol", None)
+            for definition in definitions
+        ]
+        self.datatypes = [
+            getattr(definition, "datatype", float)
+            for definition in definitions
+        ]
+        self.getters = [operator.attrgetter(var) for var in self.variables]
+
+    def __len__(self):
+        return len(self.variables)
+
+    def values(self, entities, ivars=None):
+        """Return the values of the variables (indices `ivars`, default all)
+        of all entities as float array (entity, variable). Missing values are
+        NaN.
+        """
+        if ivars is None:
+            ivars = range(len(self.variables))
+
+        # values held by the population of the entities are taken from its
+        #   arrays
+        population, index = _population(entities)
+
+        values = np.empty((len(entities), len(ivars)), dtype=np.float64)
+        for icol, ivar in enumerate(ivars):
+            if population is not None:
+                column = population.output_values(self.variables[ivar])
+                if column is not None:
+                    values[:, icol] = column[index]
+                    continue
+            try:
+                column = list(map(self.getters[ivar], entities))
+            except AttributeError:
+                column = [
+                    getattr(entity, self.variables[ivar], None)
+                    for entity in entities
+                ]
+            values[:, icol] = np.array(column, dtype=np.float64)
+        return values
+
+
+def _population(entities):
+    """Return the population all entities belong to (if any) and the index
+    of each entity in it."""
+    population = entities[0].__dict__.get("_population") if entities else None
+    if population is None:
+        return None, None
+    if any(
+        entity.__dict__.get("_population") is not population
+        for entity in entities
+    ):
+        return None, None
+    return population, np.array(
+        [entity._population_index for entity in entities], dtype=int
+    )
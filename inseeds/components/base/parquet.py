@@ -0,0 +1,86 @@
+"""Output writing to a Parquet dataset of yearly files."""
+
+import os
+import shutil
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+
+def parquet_partitions(directory):
+    """Return the yearly files of a Parquet output dataset (year: file name)
+    sorted by year."""
+    if not os.path.isdir(directory):
+        return {}
+    partitions = {}
+    for file_name in os.listdir(directory):
+        if file_name.startswith("year=") and file_name.endswith(".parquet"):
+            year = file_name.removeprefix("year=").removesuffix(".parquet")
+            partitions[int(year)] = os.path.join(directory, file_name)
+    return dict(sorted(partitions.items()))
+
+
+class ParquetWriter:
+    """Write output tables to a Parquet dataset, a directory with one file
+    per year (year=<year>.parquet).
+
+    Each write only writes the years of the table, so the cost per year
+    does not grow with the years already written, and all years written so
+    far can be read (as dataset) during the simulation or after it was
+    killed. A year written again replaces its file.
+
+    Parameters
+    ----------
+    directory : str
+        Directory of the dataset.
+    schema : pyarrow.Schema
+        Schema of the tables, the schema of the files of an existing dataset
+        is kept.
+    init : bool
+        Remove an existing dataset (or file).
+    """
+
+    def __init__(self, directory, schema, init=False):
+        self.directory = directory
+        if init:
+            if os.path.isdir(directory):
+                shutil.rmtree(directory)
+            elif os.path.isfile(directory):
+                os.remove(directory)
+        os.makedirs(directory, exist_ok=True)
+
+        # the files of the dataset have to share their schema
+        partitions = parquet_partitions(directory)
+        if partitions:
+            schema = pq.read_schema(next(iter(partitions.values())))
+        self.schema = schema
+
+    def write(self, table):
+        """Write the years of the table, each to its file."""
+        if not table.schema.equals(self.schema):
+            table = table.cast(self.schema)
+
+        for year in pc.unique(table["year"]).to_pylist():
+            file_name = os.path.join(self.directory, f"year={year}.parquet")
+            # write to a hidden temporary file first (ignored when reading
+            #   the dataset), so an interrupted write never leaves a
+            #   partially written year
+            temporary = os.path.join(
+                self.directory, f".year={year}.parquet.tmp"
+            )
+            pq.write_table(
+                table.filter(pc.equal(table["year"], year)), temporary
+            )
+            os.replace(temporary, file_name)
+
+    def close(self):
+        """Nothing to close, each year is written completely."""
+        pass
+
+
+def truncate_parquet(directory, year):
+    """Remove the output of `year` and later years from a Parquet output
+    dataset by removing their files, the files of the years before are not
+    read or written."""
+    for partition_year, file_name in parquet_partitions(directory).items():
+        if partition_year >= year:
+            os.remove(file_name)
@@ -0,0 +1,120 @@
+"""Structure-of-arrays storage of entity variables."""
+
+import numpy as np
+
+
+class PopulationVariable:
+    """Variable of an entity that is stored in an array of its `Population`.
+
+    As long as the entity is not part of a population the value is kept in
+    the instance `__dict__` (so it can be set in `__init__`), afterwards the
+    entity is a view on its element of the population array.
+
+    Parameters
+    ----------
+    dtype : type
+        Data type of the population array.
+    """
+
+    def __init__(self, dtype=float):
+        self.dtype = dtype
+        self.name = None
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, entity, owner=None):
+        if entity is None:
+            return self
+        population = entity.__dict__.get("_population")
+        if population is None:
+            try:
+                return entity.__dict__[self.name]
+            except KeyError:
+                raise AttributeError(self.name) from None
+        return population.variables[self.name][entity._population_index].item()
+
+    def __set__(self, entity, value):
+        population = entity.__dict__.get("_population")
+        if population is None:
+            entity.__dict__[self.name] = value
+        else:
+            population.variables[self.name][entity._population_index] = value
+
+    def initial_values(self, entities):
+        """Return the values of the entities for a new population array."""
+        return np.array(
+            [entity.__dict__[self.name] for entity in entities],
+            dtype=self.dtype,
+        )
+
+
+class Population:
+    """Population of entities of one entity type with their
+    `PopulationVariable` values held as contiguous NumPy arrays (one array
+    per variable), so the population can be updated with array expressions.
+
+    The entities keep working as before, their population variables are
+    views on the arrays. The order of the entities is fixed at
+    initialization and defines the order of the arrays.
+
+    Parameters
+    ----------
+    entities : list
+        Entities of the population, all of the same entity type.
+    """
+
+    def __init__(self, entities):
+        self.entities = list(entities)
+        self.index = {entity: i for i, entity in enumerate(self.entities)}
+
+        entity_type = type(self.entities[0]) if self.entities else object
+        self.variables = {
+            name: variable.initial_values(self.entities)
+            for name, variable in self.population_variables(entity_type)
+        }
+
+        # entities are views on the population arrays from now on
+        for i, entity in enumerate(self.entities):
+            for name in self.variables:
+                entity.__dict__.pop(name, None)
+            entity._population = self
+            entity._population_index = i
+
+    @staticmethod
+    def population_variables(entity_type):
+        """Return the population variables (name, variable) of an entity
+        type."""
+        names = {}
+        for cls in reversed(entity_type.__mro__):
+            for name, attribute in vars(cls).items():
+                if isinstance(attribute, PopulationVariable):
+                    names[name] = attribute
+        return list(names.items())
+
+    def __len__(self):
+        return len(self.entities)
+
+    def __iter__(self):
+        return iter(self.entities)
+
+    def __getattr__(self, name):
+        """Return the array of a population variable."""
+        try:
+            return self.__dict__["variables"][name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def output_values(self, name):
+        """Return the values of an output variable of all entities as array
+        (in the order of the population), None if not held as array."""
+        return self.variables.get(name)
+
+    def update(self, t):
+        """Update the population (all entities at once)."""
+        pass
+
+    def close(self):
+        """Free the resources of the population at the end of a
+        simulation."""
+        pass
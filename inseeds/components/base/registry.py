@@ -0,0 +1,41 @@
+"""Registry of entities by entity type."""
+
+
+class EntityRegistry:
+    """Registry of entities grouped by entity type (class name), maintained
+    incrementally when entities are added or removed.
+
+    The entities of an entity type are kept in the order of their
+    registration (or as sorted with `sort`), so iterating them is stable
+    between runs. Access to the entities of an entity type is O(1) and
+    returns a set-like view, so existing code using sets keeps working.
+    """
+
+    def __init__(self):
+        self._entities = {}
+
+    def register(self, entity):
+        """Register an entity (if not yet registered)."""
+        self._entities.setdefault(type(entity).__name__, {})[entity] = None
+
+    def deregister(self, entity):
+        """Deregister an entity (if registered)."""
+        self._entities.get(type(entity).__name__, {}).pop(entity, None)
+
+    def entities(self, entity_type):
+        """Return a set-like view on the registered entities of an entity
+        type (class name) in their stable order."""
+        return self._entities.setdefault(entity_type, {}).keys()
+
+    def first(self, entity_type):
+        """Return the first registered entity of an entity type or None."""
+        return next(iter(self._entities.get(entity_type, ())), None)
+
+    def sort(self, entity_type, key):
+        """Sort the registered entities of an entity type by `key`."""
+        self._entities[entity_type] = dict.fromkeys(
+            sorted(self.entities(entity_type), key=key)
+        )
+
+    def __contains__(self, entity):
+        return entity in self._entities.get(type(entity).__name__, {})
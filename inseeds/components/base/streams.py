@@ -0,0 +1,97 @@
+"""Reproducible counter-based random numbers."""
+
+import zlib
+import numpy as np
+
+
+class RandomStreams:
+    """Reproducible random numbers drawn as a function of the seed, a named
+    stream (e.g. "aft"), a key per entity (e.g. the cell id of a farmer)
+    and a counter (e.g. the year).
+
+    The numbers are drawn with NumPy's counter-based Philox generator. Each
+    named stream has its own Philox key spawned from the seed with
+    `numpy.random.SeedSequence`, and the generator of an entity starts at a
+    counter given by its key and the counter of the draw. Each draw is thus
+    independent of any other draw, so the numbers do not depend on the
+    order of the draws or on how the entities are partitioned.
+
+    Parameters
+    ----------
+    seed : int
+        Seed of all streams.
+    """
+
+    def __init__(self, seed):
+        self.seed = seed
+        self._stream_keys = {}
+
+    def stream_key(self, stream):
+        """Return the Philox key (2 x 64 bit) of a named stream."""
+        if stream not in self._stream_keys:
+            sequence = np.random.SeedSequence(
+                self.seed, spawn_key=(zlib.crc32(stream.encode()),)
+            )
+            self._stream_keys[stream] = sequence.generate_state(2, np.uint64)
+        return self._stream_keys[stream]
+
+    def generators(self, stream, keys, counter=0):
+        """Yield the generator of each entity key for the draws of a
+        `counter` (e.g. year) in a named stream. One generator is reset to
+        the Philox counter of each key."""
+        bit_generator = np.random.Philox(key=self.stream_key(stream))
+        generator = np.random.Generator(bit_generator)
+        state = bit_generator.state
+        for key in keys:
+            # the first word is incremented by the draws of the key
+            state["state"]["counter"] = np.array(
+                [0, counter, key, 0], dtype=np.uint64
+            )
+            # no buffered random bits
+            state["buffer_pos"] = 4
+            state["has_uint32"] = 0
+            bit_generator.state = state
+            yield generator
+
+    def _draw(self, draw, stream, keys, counter, *args):
+        """Return one draw(generator, *args) for each key, with the
+        arguments broadcast to the keys."""
+        shape = np.shape(keys)
+        args = [np.broadcast_to(arg, shape).ravel() for arg in args]
+        values = np.array(
+            [
+                draw(generator, *[arg[i] for arg in args])
+                for i, generator in enumerate(
+                    self.generators(stream, np.ravel(keys), counter)
+                )
+            ]
+        )
+        return values.reshape(shape)[()]
+
+    def random(self, stream, keys, counter=0):
+        """Return a uniform random number in [0, 1) for each key."""
+        return self._draw(
+            lambda generator: generator.random(), stream, keys, counter
+        )
+
+    def integers(self, stream, keys, low, high, counter=0):
+        """Return a random integer in [low, high) for each key."""
+        return self._draw(
+            lambda generator, low, high: generator.integers(low, high),
+            stream,
+            keys,
+            counter,
+            low,
+            high,
+        )
+
+    def normal(self, stream, keys, loc=0.0, scale=1.0, counter=0):
+        """Return a normally distributed random number for each key."""
+        return self._draw(
+            lambda generator, loc, scale: generator.normal(loc, scale),
+            stream,
+            keys,
+            counter,
+            loc,
+            scale,
+        )
@@ -1,9 +1,3 @@
-import os
-import sys
-import pandas as pd
-import pyarrow as pa
-import pyarrow.parquet as pq
-
 from . import Entity
 
 
@@ -13,20 +7,11 @@ class World(Entity):
     and parameters.
     """
 
-    @property
-    def output_table(self):
-        variables = self.get_defined_outputs()
-
-        if not variables:
-            return pd.DataFrame()
-        else:
-            df = super().output_table
-
-            if hasattr(self, "area"):
-                df.insert(
-                    5,
-                    "area [km2]",
-                    [round(self.area.sum().item() * 1e-6, 4)] * len(variables),
-                )
-
-            return df
+    @classmethod
+    def population_output_columns(cls, worlds):
+        columns = {}
+        if hasattr(worlds[0], "area"):
+            columns["area [km2]"] = [
+                round(world.area.sum().item() * 1e-6, 4) for world in worlds
+            ]
+        return columns
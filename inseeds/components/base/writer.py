@@ -0,0 +1,70 @@
+"""Background writing of output tables."""
+
+import queue
+import threading
+
+
+class OutputWriter:
+    """Write output tables in a background thread.
+
+    Tables are passed through a bounded queue to a worker thread that
+    calls `write` for each of them, so the model can continue while the
+    output is serialized and written to disk. If the queue is full, `put`
+    blocks until the worker has caught up (back-pressure). Errors of the
+    worker are raised again in the calling thread by the next `put`,
+    `flush` or `close`.
+
+    Parameters
+    ----------
+    write : callable
+        Function called by the worker thread with the arguments of `put`.
+    max_queue_size : int
+        Maximum number of tables waiting to be written.
+    """
+
+    def __init__(self, write, max_queue_size=2):
+        self._write = write
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._error = None
+        self._thread = threading.Thread(
+            target=self._run, name="inseeds-output-writer", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            args = self._queue.get()
+            try:
+                if args is None:
+                    return
+                # skip further writes after a failure, the error is raised
+                #   in the main thread
+                if self._error is None:
+                    self._write(*args)
+            except BaseException as error:
+                self._error = error
+            finally:
+                self._queue.task_done()
+
+    def put(self, *args):
+        """Queue arguments for `write`, block if the queue is full."""
+        self.raise_error()
+        self._queue.put(args)
+
+    def flush(self):
+        """Wait until all queued tables are written."""
+        self._queue.join()
+        self.raise_error()
+
+    def close(self):
+        """Write all queued tables and stop the worker thread."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self.raise_error()
+
+    def raise_error(self):
+        """Raise the error of the worker thread (if any)."""
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError("Writing output table failed") from error
@@ -1,4 +1,5 @@
 from .world import World
 from .cell import Cell
-from .farmer import Farmer
+from .farmer import Farmer, AFTParameter
+from .population import FarmerPopulation
 from .component import Component
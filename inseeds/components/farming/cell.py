@@ -8,22 +8,38 @@ class Cell(base.Cell):
 
     def __init__(self, **kwargs):
         """Initialize an instance of World."""
-        super().__init__(**kwargs)
+        super().__init__(**kwargs)  # must be the first line
+
+        # farmers of the cell by entity type
+        self.registry = base.EntityRegistry()
+
+        # register with the world (in the order of creation)
+        self.register()
 
     @property
     def farmers(self):
-        """Return the set of all farmers."""
-        farmers = {
-            farmer
-            for farmer in self.individuals
-            if farmer.__class__.__name__ == "Farmer"  # noqa
-        }
-        return farmers
+        """Return the set of all farmers (in a stable order)."""
+        return self.registry.entities("Farmer")
 
     @property
     def farmer(self):
         """Return the first farmer."""
-        farmers = self.farmers
-        if len(farmers) == 0:
-            return None
-        return list(farmers)[0]
+        return self.registry.first("Farmer")
+
+    def register(self):
+        """Register the cell with the world."""
+        self.world.registry.register(self)
+
+    def deregister(self):
+        """Deregister the cell from the world."""
+        self.world.registry.deregister(self)
+
+    def deactivate(self):
+        """Deactivate the cell and deregister it."""
+        self.deregister()
+        super().deactivate()
+
+    def reactivate(self):
+        """Reactivate the cell and register it again."""
+        super().reactivate()
+        self.register()
@@ -1,4 +1,9 @@
+import os
+import numpy as np
+
 from inseeds.components import base
+from .farmer import aft_parameter_table
+from .neighbourhood import build_neighbourhood
 
 
 class Component(base.Component):
@@ -10,28 +15,323 @@ class Component(base.Component):
     Two farmer AFTs are implemented, the traditionalist and the pioneer.
     """
 
-    def init_farmers(self, farmer_class, **kwargs):
-        """Initialize farmers."""
-        farmers = []
+    # population of all farmers updated at once (if initialized)
+    farmer_population = None
 
-        for cell in self.world.cells:
-            if cell.output.cftfrac.sum("band") == 0:
-                continue
+    # indices of the cells of the population farmers in the world input
+    _farmer_input_cells = None
+
+    # parameters of the AFTs (record per aft_id) and coupling map (inseeds
+    #   to lpjml names), converted once from the configuration
+    aft_parameters = None
+    coupling_map = None
+
+    # last year updated before the checkpoint the model was resumed from
+    resumed_year = None
+
+    # reproducible random streams of the farmers, if a seed is configured,
+    #   else the global NumPy random state is used
+    random_streams = None
+
+    def init_farmers(
+        self, farmer_class, population_class=None, checkpoint=None, **kwargs
+    ):
+        """Initialize farmers.
+
+        With `population_class` (e.g. `FarmerPopulation`) the state of the
+        farmers is held by a population that is updated at once instead of
+        updating each farmer. Its decision scheduling ("sequential" or
+        "synchronous") and number of spatial domains updated in worker
+        processes are taken from the coupled configuration
+        (`decision_scheduling`, `decision_domains`).
+
+        With a `seed` in the coupled configuration the random draws of the
+        farmers are taken from streams keyed by their cell ids
+        (`base.RandomStreams`), so the results do not depend on the order of
+        the updates or on how the population is partitioned.
+
+        With a `checkpoint` file (see `save_checkpoint`) the farmers are
+        restored with their state and neighbourhoods from the checkpoint.
+        """
+        coupled_config = self.config.coupled_config
+        scheduling = getattr(
+            coupled_config, "decision_scheduling", "sequential"
+        )
+        if scheduling != "sequential" and population_class is None:
+            raise ValueError(
+                f"Decision scheduling {scheduling} requires a population"
+            )
+
+        self.aft_parameters = aft_parameter_table(coupled_config.aftpar)
+        self.coupling_map = coupled_config.coupling_map.to_dict()
+
+        seed = getattr(coupled_config, "seed", None)
+        if seed is not None:
+            self.random_streams = base.RandomStreams(seed)
+
+        # cells (registered when created) in the order of their ids for a
+        #   reproducible initialization and output
+        self.world.registry.sort("Cell", key=lambda cell: cell.cell_id)
+
+        # state of the cells to initialize the farmers with
+        self.world.update_cell_state()
+
+        if checkpoint is not None:
+            cells, state, neighbourhood = self.read_checkpoint(checkpoint)
+        else:
+            # farmers on the cells with crops, with their initial state
+            #   derived for all farmers at once
+            cells = list(self.world.registry.entities("Cell"))
+            cftfrac = self.world.output.cftfrac
+            crop_area = (
+                np.moveaxis(cftfrac.values, cftfrac.get_axis_num("cell"), 0)
+                .reshape(cftfrac.sizes["cell"], -1)
+                .sum(1)
+            )
+            cells = [
+                cell
+                for cell, i in zip(cells, self.world.cell_indices(cells))
+                if crop_area[i] != 0
+            ]
+            state = farmer_class.initial_state(self, cells)
+
+        state = {
+            name: np.asarray(values).tolist() for name, values in state.items()
+        }
+        farmers = [
+            farmer_class(
+                cell=cell,
+                model=self,
+                init_state={name: values[i] for name, values in state.items()},
+            )
+            for i, cell in enumerate(cells)
+        ]
+
+        if checkpoint is not None:
+            # farmers in the order of the population of the checkpoint
+            farmers_sorted = farmers
+            indices, indptr = neighbourhood
+            for farmer, start, end in zip(farmers, indptr[:-1], indptr[1:]):
+                farmer.neighbourhood = [farmers[j] for j in indices[start:end]]
+        else:
+            farmers_sorted = sorted(
+                farmers, key=lambda farmer: farmer.avg_hdate
+            )
+            neighbour_cells = self.neighbour_cells(farmers_sorted)
+            for farmer in farmers_sorted:
+                farmer.init_neighbourhood(neighbour_cells.get(farmer))
+
+        if population_class is not None:
+            self.farmer_population = population_class(
+                farmers_sorted,
+                scheduling=scheduling,
+                domains=getattr(coupled_config, "decision_domains", 1),
+            )
+            self._farmer_input_cells = self.world.cell_indices(
+                [farmer.cell for farmer in self.farmer_population],
+                self.world.input,
+            )
+
+    def save_checkpoint(self, t, file_name=None):
+        """Save the state of the farmers after the update of year `t` to a
+        checkpoint file (NumPy npz) and return its name. The model can be
+        resumed from it in year `t + 1` with `from_checkpoint`, e.g. with
+        LPJmL restarted in that year.
+
+        The checkpoint holds the population arrays (including AFT ids,
+        tillage, pbc, running averages, previous values and counters for
+        strategy switch), the neighbourhoods, the ids of the entities in the
+        output and the global NumPy random state (the random streams of a
+        seeded model need no state). The default file name is
+        inseeds_checkpoint_<t>.npz in the output directory.
+        """
+        population = self.farmer_population
+        if population is None:
+            raise ValueError("Checkpoints require a farmer population")
+        if file_name is None:
+            file_name = self.get_output_file_name(
+                "npz", f"inseeds_checkpoint_{t}"
+            )
+
+        # the output up to year t is on disk with the checkpoint, the
+        #   writers are reopened in append mode by the next write
+        self.close_output_table()
 
-            farmer = farmer_class(cell=cell, model=self)
-            farmers.append(farmer)
+        _, keys, position, has_gauss, cached_gaussian = np.random.get_state()
+        arrays = {
+            "year": t,
+            "cell_id": population.cell_id,
+            # ids of the entities in the output (by the population and the
+            #   cells in the order of their ids)
+            "entity_id": [farmer.entity_id for farmer in population],
+            "cell_entity_id": [
+                cell.entity_id for cell in self.world.registry.entities("Cell")
+            ],
+            "world_entity_id": self.world.entity_id,
+            "aft_id": [farmer.aft_id for farmer in population],
+            "neighbourhood_indices": population.adjacency.indices,
+            "neighbourhood_indptr": population.adjacency.indptr,
+            "random_state": keys,
+            "random_position": position,
+            "random_has_gauss": has_gauss,
+            "random_cached_gaussian": cached_gaussian,
+        }
+        for name, values in population.variables.items():
+            arrays[f"variable_{name}"] = values
 
-        farmers_sorted = sorted(farmers, key=lambda farmer: farmer.avg_hdate)
-        for farmer in farmers_sorted:
-            farmer.init_neighbourhood()
+        # write to a temporary file first, so an interrupted write does not
+        #   replace a previous checkpoint
+        temporary = f"{file_name}.tmp.npz"
+        np.savez(temporary, **arrays)
+        os.replace(temporary, file_name)
+        return file_name
 
-        # self.world.farmers = set(farmers_sorted
+    def read_checkpoint(self, file_name):
+        """Read a checkpoint (see `save_checkpoint`) and return the cells of
+        the farmers, their state (name: values) and neighbourhoods (indices,
+        indptr). The global NumPy random state is restored."""
+        with np.load(file_name) as checkpoint:
+            checkpoint = dict(checkpoint)
+        self.resumed_year = checkpoint["year"].item()
+
+        cells = {
+            cell.cell_id: cell for cell in self.world.registry.entities("Cell")
+        }
+        cells = [cells[cell_id] for cell_id in checkpoint["cell_id"].tolist()]
+        state = {
+            "cell_index": self.world.cell_indices(cells),
+            "aft_id": checkpoint["aft_id"],
+            "entity_id": checkpoint["entity_id"],
+        }
+
+        # keep the ids of the entities in the output written before
+        self.world.entity_id = checkpoint["world_entity_id"].item()
+        for cell, entity_id in zip(
+            self.world.registry.entities("Cell"),
+            checkpoint["cell_entity_id"].tolist(),
+        ):
+            cell.entity_id = entity_id
+        for name, values in checkpoint.items():
+            if name.startswith("variable_"):
+                state[name.removeprefix("variable_")] = values
+
+        np.random.set_state(
+            (
+                "MT19937",
+                checkpoint["random_state"],
+                checkpoint["random_position"].item(),
+                checkpoint["random_has_gauss"].item(),
+                checkpoint["random_cached_gaussian"].item(),
+            )
+        )
+        neighbourhood = (
+            checkpoint["neighbourhood_indices"],
+            checkpoint["neighbourhood_indptr"],
+        )
+        return cells, state, neighbourhood
+
+    @classmethod
+    def from_checkpoint(cls, file_name, **kwargs):
+        """Return the model resumed from a checkpoint (`save_checkpoint`),
+        initialized with `kwargs` (e.g. the LPJmL coupler)."""
+        return cls(checkpoint=file_name, **kwargs)
+
+    def neighbour_cells(self, farmers):
+        """Return the neighbour cells of the cells of the farmers (farmer:
+        cells) from the `neighbourhood` settings of the coupled
+        configuration, empty without settings (the farmers use the adjacent
+        cells of the LPJmL grid).
+
+        The settings define the great-circle `radius` (km) and/or the number
+        `k` of nearest cells of a neighbourhood, optionally restricted to the
+        cells of the same country (`same_country`), cached in `cache_dir`.
+        """
+        settings = getattr(self.config.coupled_config, "neighbourhood", None)
+        if settings is None:
+            return {}
+
+        grid = self.world.grid
+        country = None
+        if getattr(settings, "same_country", False):
+            country = np.asarray(self.world.country).reshape(
+                len(grid.cell), -1
+            )
+            country = country[:, 0]
+        adjacency = build_neighbourhood(
+            grid.lon.values,
+            grid.lat.values,
+            radius=getattr(settings, "radius", None),
+            k=getattr(settings, "k", None),
+            country=country,
+            cache_dir=getattr(settings, "cache_dir", None),
+        )
+
+        # cells by their index in the grid
+        cells = list(self.world.registry.entities("Cell"))
+        grid_cells = np.empty(len(grid.cell), dtype=object)
+        grid_cells[self.world.cell_indices(cells, grid)] = cells
+
+        indices = self.world.cell_indices(
+            [farmer.cell for farmer in farmers], grid
+        )
+        neighbour_cells = {}
+        for farmer, i in zip(farmers, indices):
+            start, end = adjacency.indptr[i], adjacency.indptr[i + 1]
+            neighbour_cells[farmer] = list(
+                grid_cells[adjacency.indices[start:end]]
+            )
+        return neighbour_cells
 
     def update(self, t):
         super().update(t)
 
-        farmers_sorted = sorted(
-            self.world.farmers, key=lambda farmer: farmer.avg_hdate
-        )
-        for farmer in farmers_sorted:
-            farmer.update(t)
+        # state of the cells from the output of the previous year
+        self.world.update_cell_state()
+
+        if self.farmer_population is not None:
+            self.farmer_population.update(t)
+        else:
+            farmers_sorted = sorted(
+                self.world.farmers, key=lambda farmer: farmer.avg_hdate
+            )
+            for farmer in farmers_sorted:
+                farmer.update(t)
+
+        # set the decisions of the farmers to the LPJmL input
+        self.set_lpjml_input()
+
+    def set_lpjml_input(self):
+        """Set the mapped attributes (coupling_map) of all farmers to the
+        LPJmL input of the world, with one indexed assignment per LPJmL
+        variable."""
+        population = self.farmer_population
+        if population is not None:
+            farmers = population.entities
+            cells = self._farmer_input_cells
+        else:
+            farmers = list(self.world.farmers)
+            cells = self.world.cell_indices(
+                [farmer.cell for farmer in farmers], self.world.input
+            )
+        if not farmers:
+            return
+
+        for attribute, lpjml_attribute in self.coupling_map.items():
+            if not isinstance(lpjml_attribute, list):
+                lpjml_attribute = [lpjml_attribute]
+
+            if population is not None and attribute in population.variables:
+                values = population.variables[attribute]
+            elif all(hasattr(farmer, attribute) for farmer in farmers):
+                values = np.array(
+                    [getattr(farmer, attribute) for farmer in farmers]
+                )
+            else:
+                # not initialized from a (multi-valued) LPJmL input
+                continue
+
+            for single_var in lpjml_attribute:
+                data = self.world.input[single_var]
+                # view with the cells as first axis
+                data = np.moveaxis(data.values, data.get_axis_num("cell"), 0)
+                data[cells] = values.reshape((-1,) + (1,) * (data.ndim - 1))
@@ -0,0 +1,221 @@
+"""Spatial domain decomposition of the farmer population."""
+
+import traceback
+import weakref
+import multiprocessing
+import numpy as np
+from multiprocessing import shared_memory
+
+
+def latitude_domains(latitudes, n_domains):
+    """Return the domain of each farmer for `n_domains` latitude bands with
+    (nearly) the same number of farmers each."""
+    order = np.argsort(latitudes, kind="stable")
+    domains = np.empty(len(latitudes), dtype=int)
+    domains[order] = np.arange(len(latitudes)) * n_domains // len(latitudes)
+    return domains
+
+
+class Domain:
+    """Subdomain of the farmer population.
+
+    Parameters
+    ----------
+    farmers : numpy.ndarray
+        Indices of the farmers of the domain (sorted).
+    halo : numpy.ndarray
+        Indices of the neighbours of the farmers of the domain that belong
+        to other domains (sorted).
+    boundary : numpy.ndarray
+        Indices of the farmers of the domain that are neighbours of farmers
+        of other domains (sorted).
+    """
+
+    def __init__(self, farmers, halo, boundary):
+        self.farmers = farmers
+        self.halo = halo
+        self.boundary = boundary
+
+    def __len__(self):
+        return len(self.farmers)
+
+
+class DomainDecomposition:
+    """Decomposition of a farmer population into spatial domains, each
+    updated in a separate worker process.
+
+    The population arrays are moved to shared memory, so the workers
+    (forked from the main process) update the farmers of their domain in
+    place. Between the domains only the values of the boundary farmers are
+    exchanged (`exchange`), the neighbours of a domain in other domains
+    (halo) are defined by the adjacency matrix of the population.
+
+    Parameters
+    ----------
+    population : FarmerPopulation
+        Population to decompose.
+    domains : numpy.ndarray
+        Domain of each farmer.
+    exchanged : dict
+        Variables (name: dtype) exchanged between the domains.
+    timeout : float
+        Seconds a domain waits for the other domains in the exchange before
+        it fails.
+    """
+
+    def __init__(self, population, domains, exchanged, timeout=600):
+        self.population = population
+        self.timeout = timeout
+        self._shared_memory = []
+
+        # domains with their halo and boundary farmers
+        farmer = population._neighbour_farmer
+        neighbour = population.adjacency.indices
+        crossing = domains[farmer] != domains[neighbour]
+        self.domains = [
+            Domain(
+                farmers=np.flatnonzero(domains == domain),
+                halo=np.unique(
+                    neighbour[crossing & (domains[farmer] == domain)]
+                ),
+                boundary=np.unique(
+                    neighbour[crossing & (domains[neighbour] == domain)]
+                ),
+            )
+            for domain in np.unique(domains)
+        ]
+
+        # population arrays in shared memory
+        for name, values in population.variables.items():
+            population.variables[name] = self.shared_array(
+                values.shape, values.dtype
+            )
+            population.variables[name][:] = values
+
+        # exchange buffers of the boundary values of all domains
+        boundary = np.concatenate([domain.boundary for domain in self.domains])
+        self._slot = np.full(len(population), -1)
+        self._slot[boundary] = np.arange(len(boundary))
+        self._buffers = {
+            name: self.shared_array(len(boundary), dtype)
+            for name, dtype in exchanged.items()
+        }
+
+        self._processes = []
+        self._connections = []
+        self._finalizer = None
+
+    def shared_array(self, shape, dtype):
+        """Return a new (zero) array in shared memory, shared with the
+        workers started afterwards."""
+        size = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+        memory = shared_memory.SharedMemory(create=True, size=size)
+        self._shared_memory.append(memory)
+        array = np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+        array[...] = 0
+        return array
+
+    def start(self):
+        """Start a worker process for each domain (forked, so they hold
+        the population with its arrays in shared memory)."""
+        context = multiprocessing.get_context("fork")
+        self._barrier = context.Barrier(
+            len(self.domains), timeout=self.timeout
+        )
+        for domain in self.domains:
+            connection, worker_connection = context.Pipe()
+            process = context.Process(
+                target=self._work,
+                args=(worker_connection, domain),
+                daemon=True,
+            )
+            process.start()
+            # only the worker holds its end, so a dead worker is detected
+            worker_connection.close()
+            self._processes.append(process)
+            self._connections.append(connection)
+
+        self._finalizer = weakref.finalize(
+            self,
+            _shutdown,
+            self._connections,
+            self._processes,
+            self._shared_memory,
+        )
+
+    def _work(self, connection, domain):
+        """Run the commands (population methods) for a domain."""
+        while True:
+            command = connection.recv()
+            if command is None:
+                break
+            method, args = command
+            try:
+                result = getattr(self.population, method)(domain, *args)
+                connection.send(("done", result))
+            except Exception:
+                # release the domains waiting for this one in the exchange
+                self._barrier.abort()
+                connection.send(("error", traceback.format_exc()))
+
+    def run(self, method, *args):
+        """Call the population method `method(domain, *args)` for all
+        domains in their workers and return the results."""
+        for connection in self._connections:
+            connection.send((method, args))
+        results = []
+        for connection in self._connections:
+            try:
+                results.append(connection.recv())
+            except EOFError:
+                results.append(("error", "Domain worker process died"))
+        errors = [result for status, result in results if status == "error"]
+        if errors:
+            # all workers returned, none is waiting in the exchange
+            self._barrier.reset()
+            raise RuntimeError("Domain update failed:\n" + "\n".join(errors))
+        return [result for _, result in results]
+
+    def exchange(self, domain, values):
+        """Exchange the values (name: values of all farmers of the domain)
+        of the boundary farmers between the domains. Return the values of
+        the halo of the domain."""
+        boundary = np.searchsorted(domain.farmers, domain.boundary)
+        for name, buffer in self._buffers.items():
+            buffer[self._slot[domain.boundary]] = values[name][boundary]
+
+        # wait for all domains to provide their boundary values
+        self._barrier.wait()
+
+        return {
+            name: buffer[self._slot[domain.halo]]
+            for name, buffer in self._buffers.items()
+        }
+
+    def close(self):
+        """Stop the workers and free the shared memory, the population
+        arrays are copied back to memory of the main process."""
+        for name, values in self.population.variables.items():
+            self.population.variables[name] = values.copy()
+        if self._finalizer is not None:
+            self._finalizer()
+        else:
+            _shutdown([], [], self._shared_memory)
+
+
+def _shutdown(connections, processes, shared_memories):
+    """Stop the worker processes and free the shared memory."""
+    for connection in connections:
+        try:
+            connection.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+    for process in processes:
+        process.join(timeout=5)
+    for memory in shared_memories:
+        try:
+            memory.close()
+        except BufferError:
+            # still referenced by arrays, freed with them
+            pass
+        memory.unlink()
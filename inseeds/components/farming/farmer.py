@@ -22,21 +22,106 @@ class AFT(Enum):
     pioneer: int = 1
 
     @staticmethod
-    def random(pioneer_share=0.5):
+    def random(pioneer_share=0.5, random=None):
+        """Return a random AFT, pioneer with probability `pioneer_share`.
+        `random` is a uniform random number in [0, 1) to decide by, default
+        drawn from the global NumPy random state."""
+        if random is not None:
+            return (
+                AFT.pioneer if random < pioneer_share else AFT.traditionalist
+            )
         return np.random.choice(
             [AFT.pioneer, AFT.traditionalist],
             p=[pioneer_share, 1 - pioneer_share],
         )
 
 
+def aft_parameter_table(aftpar):
+    """Return the parameters of the AFTs (`aftpar` of the coupled
+    configuration) as NumPy structured array with one record per AFT,
+    indexed by `aft_id`."""
+    parameters = {aft: getattr(aftpar, aft.name).to_dict() for aft in AFT}
+    names = list(
+        dict.fromkeys(
+            name for values in parameters.values() for name in values
+        )
+    )
+    dtype = []
+    for name in names:
+        values = [np.asarray(values[name]) for values in parameters.values()]
+        dtype.append((name, np.result_type(*values)))
+    table = np.zeros(len(AFT), dtype=dtype)
+    for aft, values in parameters.items():
+        table[aft.value] = tuple(values[name] for name in names)
+    return table
+
+
+class AFTParameter(base.PopulationVariable):
+    """Population variable of a farmer initialized from the parameters of its
+    AFT (`aft_parameters` of the model), so the parameters are not copied to
+    each farmer. A value set for a single farmer (e.g. the changing pbc)
+    overrides the parameter of its AFT.
+    """
+
+    def __get__(self, entity, owner=None):
+        if entity is None:
+            return self
+        if entity.__dict__.get("_population") is None:
+            if self.name not in entity.__dict__:
+                record = entity.model.aft_parameters[entity.aft_id]
+                return record[self.name].item()
+        return super().__get__(entity, owner)
+
+    def initial_values(self, entities):
+        if not entities:
+            return np.array([], dtype=self.dtype)
+        aft_ids = np.array([entity.aft_id for entity in entities], dtype=int)
+        values = (
+            entities[0]
+            .model.aft_parameters[self.name][aft_ids]
+            .astype(self.dtype)
+        )
+        # values set for single farmers
+        for i, entity in enumerate(entities):
+            if self.name in entity.__dict__:
+                values[i] = entity.__dict__[self.name]
+        return values
+
+
 class Farmer(core.Individual, base.Individual):
     """Farmer (Individual) entity type mixin class."""
 
+    # the AFT of a farmer does not change during a simulation
+    static_output_variables = ["aft_id"]
+
+    # state of the farmer, held by the FarmerPopulation once initialized
+    avg_hdate = base.PopulationVariable(float)
+    soilc = base.PopulationVariable(float)
+    cropyield = base.PopulationVariable(float)
+    strategy_switch_duration = AFTParameter(int)
+
     # standard methods:
-    def __init__(self, **kwargs):
-        """Initialize an instance of Farmer."""
+    def __init__(self, init_state=None, **kwargs):
+        """Initialize an instance of Farmer.
+
+        `init_state` is the initial state of the farmer (name: value) as
+        derived for many farmers at once with `initial_state`, else the
+        state is derived for the single farmer.
+        """
         super().__init__(**kwargs)  # must be the first line
 
+        # register with the cell and the world (farmers do not move)
+        self.register()
+
+        if init_state is not None:
+            self.aft = AFT(init_state["aft_id"])
+            for name, value in init_state.items():
+                setattr(self, name, value)
+            return
+
+        # index of the cell in the world output (and cell state)
+        self.cell_index = self.world.cell_indices([self.cell])[0]
+
         # initialize the AFT specific attributes
         self.init_aft()
 
@@ -54,33 +139,91 @@ class Farmer(core.Individual, base.Individual):
         # Same applies for cropyield (as for soilc)
         self.cropyield = self.cell_cropyield
 
+    @classmethod
+    def initial_state(cls, model, cells):
+        """Return the initial state of the farmers of the given cells as
+        arrays (name: value of each farmer), derived at once from the world
+        input and output. The AFTs are drawn from the random streams of the
+        model if seeded, else from the global NumPy random state."""
+        world = model.world
+        cell_index = world.cell_indices(cells)
+
+        # assign the AFTs
+        pioneer_share = model.config.coupled_config.pioneer_share
+        if model.random_streams is not None:
+            random = model.random_streams.random(
+                "aft", [cell.cell_id for cell in cells]
+            )
+        else:
+            random = np.random.random_sample(len(cells))
+        state = {
+            "cell_index": cell_index,
+            "aft_id": np.where(
+                random < pioneer_share,
+                AFT.pioneer.value,
+                AFT.traditionalist.value,
+            ),
+        }
+
+        # mapped variables of the LPJmL input with one value per cell
+        input_index = world.cell_indices(cells, world.input)
+        for attribute, lpjml_attribute in model.coupling_map.items():
+            if not isinstance(lpjml_attribute, list):
+                lpjml_attribute = [lpjml_attribute]
+
+            for single_var in lpjml_attribute:
+                data = world.input[single_var]
+                if data.size != data.sizes["cell"]:
+                    continue
+                values = np.moveaxis(data.values, data.get_axis_num("cell"), 0)
+                state[attribute] = values.reshape(-1)[input_index]
+
+        # average harvest date, soilc and cropyield of the cells
+        for name, values in world.cell_state.items():
+            state[name] = values[cell_index]
+
+        return state
+
+    def register(self):
+        """Register the farmer with its cell and the world."""
+        self.cell.registry.register(self)
+        self.world.registry.register(self)
+
+    def deregister(self):
+        """Deregister the farmer from its cell and the world."""
+        self.cell.registry.deregister(self)
+        self.world.registry.deregister(self)
+
+    def deactivate(self):
+        """Deactivate the farmer and deregister it."""
+        self.deregister()
+        super().deactivate()
+
+    def reactivate(self):
+        """Reactivate the farmer and register it again."""
+        super().reactivate()
+        self.register()
+
     def init_aft(self):
         """Initialize the AFT of the agent."""
 
         # assign aft to farmer
-        self.aft = AFT.random(self.model.config.coupled_config.pioneer_share)
+        random = None
+        if self.model.random_streams is not None:
+            random = self.model.random_streams.random("aft", self.cell.cell_id)
+        self.aft = AFT.random(
+            self.model.config.coupled_config.pioneer_share, random
+        )
         self.aft_id = self.aft.value
 
-        # assign configuration to aft specific farmer
-        self.__dict__.update(
-            getattr(
-                self.model.config.coupled_config.aftpar, self.aft.name
-            ).to_dict()
-        )
+        # the AFT specific parameters are resolved through the AFT parameter
+        #   table of the model (`AFTParameter`)
 
     def init_coupled_attributes(self):
         """Initialize the mapped variables from the LPJmL output to the
         farmers
         """
 
-        # get the coupling map (inseeds to lpjml names) from the configuration
-        self.coupling_map = (
-            self.model.config.coupled_config.coupling_map.to_dict()
-        )
-
-        # set control run argument
-        self.control_run = self.model.config.coupled_config.control_run
-
         # set the mapped variables from the farmers to the LPJmL input
         for attribute, lpjml_attribute in self.coupling_map.items():
             if not isinstance(lpjml_attribute, list):
@@ -91,15 +234,27 @@ class Farmer(core.Individual, base.Individual):
                     continue
                 setattr(self, attribute, self.cell.input[single_var].item())
 
-    def init_neighbourhood(self):
-        """Initialize the neighbourhood of the agent."""
+    def init_neighbourhood(self, cells=None):
+        """Initialize the neighbourhood of the agent: the farmers of the
+        given neighbour `cells`, default the adjacent cells of its cell."""
+        if cells is None:
+            cells = self.cell.neighbourhood
         self.neighbourhood = [
             neighbour
-            for cell_neighbours in self.cell.neighbourhood
-            if len(cell_neighbours.individuals) > 0
-            for neighbour in cell_neighbours.individuals
+            for cell_neighbours in cells
+            for neighbour in cell_neighbours.farmers
         ]
 
+    @property
+    def coupling_map(self):
+        """Return the coupling map (inseeds to lpjml names) of the model."""
+        return self.model.coupling_map
+
+    @property
+    def control_run(self):
+        """Return whether the model runs as control run."""
+        return self.model.config.coupled_config.control_run
+
     @property
     def farmers(self):
         """Return the set of all farmers in the neighbourhood."""
@@ -108,35 +263,17 @@ class Farmer(core.Individual, base.Individual):
     @property
     def cell_cropyield(self):
         """Return the average crop yield of the cell."""
-        if self.cell.output.harvestc.values.mean() == 0:
-            return 1e-3
-        else:
-            return self.cell.output.harvestc.values.mean()
+        return self.world.cell_state["cropyield"][self.cell_index].item()
 
     @property
     def cell_soilc(self):
         """Return the average soil carbon of the cell."""
-        if self.cell.output.soilc_agr_layer.values[0].item() == 0:
-            return 1e-3
-        else:
-            return self.cell.output.soilc_agr_layer.values[0].item()
+        return self.world.cell_state["soilc"][self.cell_index].item()
 
     @property
     def cell_avg_hdate(self):
         """Return the average harvest date of the cell."""
-        check = self.cell.output.hdate.band.values
-        crop_idx = [
-            i
-            for i, item in enumerate(self.cell.output.hdate.band.values)
-            if any(x in item for x in self.model.config.cftmap)
-        ]
-        if np.sum(self.cell.output.cftfrac.isel(band=crop_idx).values) == 0:
-            return 365
-        else:
-            return np.average(
-                self.cell.output.hdate,
-                weights=self.cell.output.cftfrac.isel(band=crop_idx),
-            )
+        return self.world.cell_state["avg_hdate"][self.cell_index].item()
 
     def set_lpjml(self, attribute):
         """Set the mapped variables from the farmers to the LPJmL input"""
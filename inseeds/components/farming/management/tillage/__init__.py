@@ -1 +1,2 @@
 from .farmer import Farmer
+from .population import FarmerPopulation
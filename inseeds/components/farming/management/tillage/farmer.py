@@ -2,15 +2,32 @@
 
 import numpy as np
 
+import inseeds.components.base as base
 from inseeds.components import farming
 
 
 class Farmer(farming.Farmer):
     """Farmer (Individual) entity type mixin class."""
 
-    def __init__(self, **kwargs):
+    # state of the farmer, held by the FarmerPopulation once initialized
+    soilc_previous = base.PopulationVariable(float)
+    cropyield_previous = base.PopulationVariable(float)
+    tillage = base.PopulationVariable(int)
+    pbc = farming.AFTParameter(float)
+    strategy_switch_time = base.PopulationVariable(float)
+    tpb = base.PopulationVariable(float)
+
+    # AFT parameters
+    weight_attitude = farming.AFTParameter(float)
+    weight_norm = farming.AFTParameter(float)
+    weight_yield = farming.AFTParameter(float)
+    weight_soil = farming.AFTParameter(float)
+    weight_social_learning = farming.AFTParameter(float)
+    weight_own_land = farming.AFTParameter(float)
+
+    def __init__(self, init_state=None, **kwargs):
         """Initialize an instance of Farmer."""
-        super().__init__(**kwargs)  # must be the first line
+        super().__init__(init_state=init_state, **kwargs)  # must be first
 
         # initialize previous soilc
         self.soilc_previous = self.soilc
@@ -19,14 +36,48 @@ class Farmer(farming.Farmer):
         self.cropyield_previous = self.cropyield
 
         # Randomize switch time at beginning of simulation to avoid
-        #   synchronization of agents
-        self.strategy_switch_time = np.random.randint(
-            0, self.strategy_switch_duration
-        )
+        #   synchronization of agents (drawn with the initial state if given,
+        #   see `initial_state`)
+        streams = self.model.random_streams
+        if init_state is None and streams is not None:
+            self.strategy_switch_time = streams.integers(
+                "initial_switch_time",
+                self.cell.cell_id,
+                0,
+                self.strategy_switch_duration,
+            ).item()
+        elif init_state is None:
+            self.strategy_switch_time = np.random.randint(
+                0, self.strategy_switch_duration
+            )
 
         # initialize tbp for meaningful output
         self.tpb = 0
 
+        # given state (e.g. of a checkpoint) replaces the initialization
+        for name in ["soilc_previous", "cropyield_previous", "tpb"]:
+            if init_state is not None and name in init_state:
+                setattr(self, name, init_state[name])
+
+    @classmethod
+    def initial_state(cls, model, cells):
+        state = super().initial_state(model, cells)
+
+        # randomized switch times (see __init__)
+        duration = model.aft_parameters["strategy_switch_duration"][
+            state["aft_id"]
+        ]
+        if model.random_streams is not None:
+            state["strategy_switch_time"] = model.random_streams.integers(
+                "initial_switch_time",
+                [cell.cell_id for cell in cells],
+                0,
+                duration,
+            )
+        else:
+            state["strategy_switch_time"] = np.random.randint(0, duration)
+        return state
+
     @property
     def attitude(self):
         """Calculate the attitude of the farmer following the TPB"""
@@ -162,10 +213,7 @@ class Farmer(farming.Farmer):
                 self.pbc = max(self.pbc - 0.25, 0.5)
 
                 # set back counter for strategy switch
-                self.strategy_switch_time = np.random.normal(
-                    self.strategy_switch_duration,
-                    round(self.strategy_switch_duration / 2),
-                )
+                self.strategy_switch_time = self.draw_switch_time(t)
 
                 # freeze the current soilc and cropyield values that were used
                 #   for the decision making in the next evaluation after
@@ -173,10 +221,6 @@ class Farmer(farming.Farmer):
                 self.cropyield_previous = self.cropyield
                 self.soilc_previous = self.soilc
 
-                # set the values of the farmers attributes to the LPJmL
-                #   variables
-                self.set_lpjml(attribute="tillage")
-
             # increase pbc if tpb is near 0.5 to learn from own experience
             elif self.tpb <= 0.5 and self.tpb > 0.4:
                 self.pbc = min(
@@ -187,6 +231,21 @@ class Farmer(farming.Farmer):
             # decrease the counter for strategy switch time each year
             self.strategy_switch_time -= 1
 
+    def draw_switch_time(self, t):
+        """Draw the counter for strategy switch after a switch in year `t`
+        (normal around strategy_switch_duration)."""
+        duration = self.strategy_switch_duration
+        streams = self.model.random_streams
+        if streams is not None:
+            return streams.normal(
+                "switch_time",
+                self.cell.cell_id,
+                duration,
+                round(duration / 2),
+                counter=t,
+            ).item()
+        return np.random.normal(duration, round(duration / 2))
+
 
 def sigmoid(x):
     """The following part contains helping stuff"""
@@ -0,0 +1,476 @@
+"""FarmerPopulation class of inseeds_farmer_management"""
+
+import numpy as np
+
+from inseeds.components import farming
+from inseeds.components.farming.scheduling import DecisionCalendar
+from .farmer import sigmoid
+
+
+class FarmerPopulation(farming.FarmerPopulation):
+    """Population of all farmers evaluating the TPB for all farmers with a
+    few array expressions.
+
+    The result is the same as updating the farmers one after another in the
+    order of their decisions (`decision_order`): a farmer sees the new
+    state (running averages and tillage) of the neighbours that decided
+    before and the previous state of the neighbours that decide after it.
+    The farmers that evaluate the TPB in a year are grouped into levels, a
+    level depending only on the decisions of neighbours in lower levels, so
+    each level is evaluated at once.
+
+    With synchronous scheduling all farmers see the previous state of their
+    neighbours and are evaluated at once (a single level), optionally split
+    into spatial domains updated in worker processes (`update_domain`).
+    """
+
+    exchanged_variables = farming.FarmerPopulation.exchanged_variables + [
+        "tillage"
+    ]
+
+    # TPB quantities derived once per timestep from the state after the
+    #   update for the output (see `derived`)
+    derived_variables = [
+        "attitude",
+        "attitude_own_land",
+        "attitude_social_learning",
+        "social_norm",
+    ]
+
+    # state of the farmers the derived quantities depend on (own state and
+    #   that of their neighbours)
+    memo_inputs = [
+        "tillage",
+        "cropyield",
+        "soilc",
+        "cropyield_previous",
+        "soilc_previous",
+        "weight_yield",
+        "weight_soil",
+        "weight_social_learning",
+        "weight_own_land",
+    ]
+
+    # timestep of the last update and memo of the derived quantities (with
+    #   the state they are derived from)
+    t = None
+    _memo = None
+
+    # calendar of the next decisions and the counters for strategy switch
+    #   it was scheduled with (rescheduled if changed outside the update)
+    calendar = None
+    _scheduled = None
+
+    # number of neighbours using tillage of each farmer, updated on strategy
+    #   switches, and the tillage it was counted with (recounted if changed
+    #   outside the update)
+    _tillage_neighbours = None
+    _counted_tillage = None
+
+    # cross-check the incrementally updated neighbourhood aggregates against
+    #   their recomputation (debug mode)
+    check_aggregates = False
+
+    # farmers that have a farmer as neighbour (transposed adjacency)
+    _seen_by = None
+
+    def __init__(self, farmers, **kwargs):
+        # set before the domain workers are forked by the initialization
+        if farmers:
+            coupled_config = farmers[0].model.config.coupled_config
+            self.check_aggregates = getattr(
+                coupled_config, "debug_aggregates", False
+            )
+        super().__init__(farmers, **kwargs)
+        if self._seen_by is None:
+            self.init_seen_by()
+
+    def init_seen_by(self):
+        """Set the farmers that have a farmer as neighbour (transposed
+        adjacency)."""
+        self._seen_by = self.adjacency.T.tocsr()
+
+    def decompose(self, n_domains):
+        self.init_seen_by()
+        super().decompose(n_domains)
+        # aggregates updated by the main process, read by the workers
+        self._tillage_neighbours = self.decomposition.shared_array(
+            len(self), int
+        )
+        self._counted_tillage = self.decomposition.shared_array(
+            len(self), self.tillage.dtype
+        )
+
+    def update(self, t):
+        self.t = t
+
+        if self.decomposition is not None:
+            self.update_domains(t)
+            return
+
+        # decision order by the average harvest date of the previous year
+        rank = np.empty(len(self), dtype=int)
+        rank[self.decision_order] = np.arange(len(self))
+
+        previous = {
+            name: self.variables[name].copy()
+            for name in self.exchanged_variables
+        }
+
+        # update average harvest date and running averages
+        super().update(t)
+        self.count_tillage_neighbours()
+
+        # neighbours that decide before a farmer are seen with their new
+        #   state (for each entry of the adjacency matrix), none with
+        #   synchronous scheduling
+        if self.scheduling == "synchronous":
+            decided_before = np.zeros(self.adjacency.nnz, dtype=bool)
+        else:
+            decided_before = (
+                rank[self.adjacency.indices] < rank[self._neighbour_farmer]
+            )
+
+        # If strategy switch time is down to 0 calculate TPB-based strategy
+        # switch probability value, else decrease the counter
+        due = self.due_farmers(t)
+        deciding = np.zeros(len(self), dtype=bool)
+        deciding[due] = True
+        self.strategy_switch_time[~deciding] -= 1
+
+        levels = self.decision_levels(deciding, decided_before)
+        switched = []
+        for level in range(levels.max(initial=-1) + 1):
+            switched.append(
+                self.evaluate_tpb(
+                    np.flatnonzero(levels == level), decided_before, previous
+                )
+            )
+            # the next level sees the switches of this level
+            self.update_aggregates(switched[-1])
+        switched = np.concatenate(switched + [np.array([], dtype=int)])
+
+        self.reset_switch_time(switched, rank)
+        self.schedule_decisions(due, t + 1)
+
+    def count_tillage_neighbours(self):
+        """Count the neighbours using tillage of each farmer, if the tillage
+        was changed since the last count (outside the update), else the
+        counts are kept up to date by `update_aggregates`."""
+        if self._tillage_neighbours is None:
+            # no neighbours using tillage if no farmer uses tillage
+            self._tillage_neighbours = np.zeros(len(self), dtype=int)
+            self._counted_tillage = np.zeros(len(self), self.tillage.dtype)
+        if np.array_equal(self._counted_tillage, self.tillage):
+            return
+        counts = self.adjacency @ (self.tillage != 0).astype(float)
+        self._tillage_neighbours[:] = counts
+        self._counted_tillage[:] = self.tillage
+
+    def update_aggregates(self, switched):
+        """Update the neighbourhood aggregates (number of neighbours using
+        tillage) of the farmers that have the switched farmers (indices) as
+        neighbour, O(degree) for each switch."""
+        if not len(switched):
+            return
+        seen_by = self._seen_by[switched]
+        delta = np.where(self.tillage[switched] != 0, 1, -1)
+        np.add.at(
+            self._tillage_neighbours,
+            seen_by.indices,
+            (seen_by.data * np.repeat(delta, np.diff(seen_by.indptr))).astype(
+                int
+            ),
+        )
+        self._counted_tillage[switched] = self.tillage[switched]
+
+    def decision_years(self, farmers, t):
+        """Return the year of the next decision of the farmers with their
+        counters for strategy switch as seen by the update of year `t`: the
+        counter is decreased by 1 each year until it is down to 0."""
+        counters = self.strategy_switch_time[farmers]
+        return t + np.maximum(np.ceil(counters), 0).astype(int)
+
+    def due_farmers(self, t):
+        """Return the farmers (sorted) deciding in year `t` from the
+        calendar of their decisions, rescheduled from their counters for
+        strategy switch if these were changed outside the update."""
+        if self._scheduled is None or not np.array_equal(
+            self._scheduled, self.strategy_switch_time
+        ):
+            self.calendar = DecisionCalendar()
+            farmers = np.arange(len(self))
+            self.calendar.schedule(farmers, self.decision_years(farmers, t))
+        return self.calendar.due(t)
+
+    def schedule_decisions(self, farmers, t):
+        """Schedule the next decisions of the farmers that decided in the
+        year before `t` (the others keep their scheduled decisions)."""
+        self.calendar.schedule(farmers, self.decision_years(farmers, t))
+        self._scheduled = self.strategy_switch_time.copy()
+
+    def update_domains(self, t):
+        """Update the population split into domains, each domain updated
+        by its worker process (`update_domain`). The result is the same as
+        the update with synchronous scheduling."""
+        # decision order by the average harvest date of the previous year
+        rank = np.empty(len(self), dtype=int)
+        rank[self.decision_order] = np.arange(len(self))
+
+        for name, values in self.farmer_cell_state().items():
+            self._domain_cell_state[name][:] = values
+
+        self.count_tillage_neighbours()
+        switched = np.concatenate(
+            self.decomposition.run("update_domain") + [np.array([], dtype=int)]
+        )
+        self.update_aggregates(switched)
+        self.reset_switch_time(switched, rank)
+
+        # the domains find their deciding farmers from the counters
+        self._scheduled = None
+
+    def update_domain(self, domain):
+        """Update the farmers of a domain (in its worker process) and return
+        the switching farmers. The previous state of the neighbours in
+        other domains is exchanged with them (halo exchange)."""
+        farmers = domain.farmers
+        own = {
+            name: self.variables[name][farmers]
+            for name in self.exchanged_variables
+        }
+        halo = self.decomposition.exchange(domain, own)
+
+        # update average harvest date and running averages
+        self.update_state(
+            {
+                name: values[farmers]
+                for name, values in self._domain_cell_state.items()
+            },
+            farmers,
+        )
+
+        deciding = self.strategy_switch_time[farmers] <= 0
+        self.strategy_switch_time[farmers[~deciding]] -= 1
+
+        # previous state of the farmers of the domain and their halo
+        previous = {}
+        for name, values in own.items():
+            previous[name] = np.zeros(len(self), dtype=values.dtype)
+            previous[name][farmers] = values
+            previous[name][domain.halo] = halo[name]
+
+        return self.evaluate_tpb(
+            farmers[deciding],
+            np.zeros(self.adjacency.nnz, dtype=bool),
+            previous,
+        )
+
+    def reset_switch_time(self, switched, rank):
+        """Set back the counter for strategy switch of the switched farmers,
+        drawn from their random streams or else from the global random state
+        in the order of the decisions (`rank`)."""
+        switched = switched[np.argsort(rank[switched])]
+        duration = self.strategy_switch_duration[switched]
+        streams = self.entities[0].model.random_streams
+        if streams is not None:
+            self.strategy_switch_time[switched] = streams.normal(
+                "switch_time",
+                self.cell_id[switched],
+                duration,
+                np.round(duration / 2),
+                counter=self.t,
+            )
+        else:
+            self.strategy_switch_time[switched] = np.random.normal(
+                duration, np.round(duration / 2)
+            )
+
+    def decision_levels(self, deciding, decided_before):
+        """Return the level of each deciding farmer (-1 for the others): one
+        more than the highest level of the deciding neighbours that decide
+        before the farmer."""
+        farmer = self._neighbour_farmer
+        neighbour = self.adjacency.indices
+        dependency = deciding[farmer] & deciding[neighbour] & decided_before
+        farmer, neighbour = farmer[dependency], neighbour[dependency]
+
+        levels = np.zeros(len(self), dtype=int)
+        while True:
+            updated = levels.copy()
+            np.maximum.at(updated, farmer, levels[neighbour] + 1)
+            if np.array_equal(updated, levels):
+                break
+            levels = updated
+        return np.where(deciding, levels, -1)
+
+    def tpb_quantities(self, farmers, decided_before, previous):
+        """Return the derived TPB quantities (`derived_variables`) of the
+        given farmers (indices). Neighbours that decided before are seen
+        with their current state, the others with their `previous` state.
+        """
+        entries = self.neighbourhood_entries(farmers)
+        neighbour = self.adjacency.indices[entries]
+        decided_before = decided_before[entries]
+        degree = self.degree[farmers]
+        tillage = self.tillage[farmers]
+
+        # state of the neighbours as seen by the farmers
+        seen = {
+            name: np.where(
+                decided_before,
+                self.variables[name][neighbour],
+                previous[name][neighbour],
+            )
+            for name in self.exchanged_variables
+        }
+
+        # social norm based on the majority behaviour of the neighbours: the
+        #   number of neighbours using tillage, corrected by the neighbours
+        #   seen with another than their counted tillage
+        seen_tillage = (seen["tillage"] != 0).astype(int)
+        mismatch = seen_tillage != (self._counted_tillage[neighbour] != 0)
+        neighbours_tillage = self._tillage_neighbours[farmers] + np.bincount(
+            np.repeat(np.arange(len(farmers)), degree)[mismatch],
+            weights=2 * seen_tillage[mismatch] - 1,
+            minlength=len(farmers),
+        ).astype(int)
+        if self.check_aggregates:
+            recounted = self.weighted_adjacency(
+                seen_tillage.astype(float), farmers
+            ) @ np.ones(len(self))
+            if not np.array_equal(neighbours_tillage, recounted):
+                raise RuntimeError(
+                    "Neighbourhood aggregates differ from their recomputation"
+                )
+        with np.errstate(invalid="ignore", divide="ignore"):
+            tillage_share = np.where(
+                degree > 0, neighbours_tillage / degree, 0
+            )
+        social_norm = np.where(
+            tillage == 1,
+            sigmoid(0.5 - tillage_share),
+            sigmoid(tillage_share - 0.5),
+        )
+
+        # social learning: compare to the average status of the neighbours
+        #   that are using a different strategy (NaN if there are none)
+        different = (seen["tillage"] != 0) == np.repeat(tillage == 0, degree)
+        count = np.where(
+            tillage == 0, neighbours_tillage, degree - neighbours_tillage
+        )
+
+        comparisons = []
+        for name in ["cropyield", "soilc"]:
+            total = self.neighbourhood_sum(
+                np.where(different, seen[name], 0), farmers
+            )
+            with np.errstate(invalid="ignore", divide="ignore"):
+                comparisons.append(
+                    np.where(
+                        count > 0,
+                        total / count / self.variables[name][farmers] - 1,
+                        0,
+                    )
+                )
+        yield_comparison, soil_comparison = comparisons
+
+        weight_yield = self.weight_yield[farmers]
+        weight_soil = self.weight_soil[farmers]
+        attitude_social_learning = sigmoid(
+            weight_yield * yield_comparison + weight_soil * soil_comparison
+        )
+
+        # attitude based on own land: compare own soil and yield to previous
+        #   values
+        attitude_own_soil = (
+            self.soilc_previous[farmers] / self.soilc[farmers] - 1
+        )
+        attitude_own_yield = (
+            self.cropyield_previous[farmers] / self.cropyield[farmers] - 1
+        )
+        attitude_own_land = sigmoid(
+            weight_yield * attitude_own_yield + weight_soil * attitude_own_soil
+        )
+
+        attitude = (
+            self.weight_social_learning[farmers] * attitude_social_learning
+            + self.weight_own_land[farmers] * attitude_own_land
+        )
+
+        return {
+            "attitude": attitude,
+            "attitude_own_land": attitude_own_land,
+            "attitude_social_learning": attitude_social_learning,
+            "social_norm": social_norm,
+        }
+
+    def evaluate_tpb(self, farmers, decided_before, previous):
+        """Evaluate the TPB of the given farmers (indices) and apply the
+        resulting strategy switches. Neighbours that decided before are seen
+        with their current state, the others with their `previous` state.
+        Return the switching farmers.
+        """
+        quantities = self.tpb_quantities(farmers, decided_before, previous)
+
+        tpb = (
+            self.weight_attitude[farmers] * quantities["attitude"]
+            + self.weight_norm[farmers] * quantities["social_norm"]
+        ) * self.pbc[farmers]
+        self.tpb[farmers] = tpb
+
+        # switch strategy and decrease pbc after strategy switch
+        switching = farmers[tpb > 0.5]
+        self.tillage[switching] = self.tillage[switching] == 0
+        self.pbc[switching] = np.maximum(self.pbc[switching] - 0.25, 0.5)
+
+        # freeze the current soilc and cropyield values that were used for
+        #   the decision making in the next evaluation
+        self.cropyield_previous[switching] = self.cropyield[switching]
+        self.soilc_previous[switching] = self.soilc[switching]
+
+        # increase pbc if tpb is near 0.5 to learn from own experience
+        learning = farmers[(tpb <= 0.5) & (tpb > 0.4)]
+        self.pbc[learning] = np.minimum(
+            self.pbc[learning]
+            + 0.25 / self.strategy_switch_duration[learning],
+            1,
+        )
+        return switching
+
+    def derived(self, name, i=None):
+        """Return a derived TPB quantity (`derived_variables`) of all
+        farmers or of farmer `i`. The quantities are derived for all farmers
+        at once from their state after the update and memoized for the
+        timestep, derived again only if the state was changed since.
+        """
+        memo = self._memo
+        if (
+            memo is None
+            or memo["t"] != self.t
+            or not all(
+                np.array_equal(values, self.variables[name], equal_nan=True)
+                for name, values in memo["state"].items()
+            )
+        ):
+            self.count_tillage_neighbours()
+            memo = self._memo = {
+                "t": self.t,
+                "quantities": self.tpb_quantities(
+                    np.arange(len(self)),
+                    np.ones(self.adjacency.nnz, dtype=bool),
+                    self.variables,
+                ),
+                "state": {
+                    name: self.variables[name].copy()
+                    for name in self.memo_inputs
+                },
+            }
+
+        values = memo["quantities"][name]
+        return values if i is None else values[i].item()
+
+    def output_values(self, name):
+        if name in self.derived_variables:
+            return self.derived(name)
+        return super().output_values(name)
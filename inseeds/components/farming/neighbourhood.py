@@ -0,0 +1,147 @@
+"""Neighbourhoods of the cells from a spatial index of their coordinates."""
+
+import os
+import hashlib
+import numpy as np
+from scipy import sparse
+from scipy.spatial import cKDTree
+
+# mean radius of the earth in km
+EARTH_RADIUS = 6371.0
+
+# version of the neighbourhood cache files, to be increased if the
+#   neighbourhoods change for the same parameters
+CACHE_VERSION = 1
+
+
+def unit_vectors(lon, lat):
+    """Return the cartesian coordinates of the points (degrees) on the unit
+    sphere."""
+    lon, lat = np.radians(lon), np.radians(lat)
+    return np.column_stack(
+        [np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)]
+    )
+
+
+def great_circle_distance(lon1, lat1, lon2, lat2):
+    """Return the great-circle distance (km) between points (degrees)."""
+    lon1, lat1, lon2, lat2 = map(np.radians, (lon1, lat1, lon2, lat2))
+    haversine = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(haversine, 1)))
+
+
+def neighbourhood_adjacency(lon, lat, radius=None, k=None, country=None):
+    """Return the neighbourhoods of the cells as sparse adjacency matrix
+    (CSR, cell by neighbour cell) built with a KD-tree over the cell
+    coordinates. The neighbours of a cell are ordered by distance (then
+    index), the cell itself is no neighbour.
+
+    Parameters
+    ----------
+    lon, lat : numpy.ndarray
+        Coordinates of the cells (degrees).
+    radius : float
+        Great-circle radius (km) of the neighbourhood.
+    k : int
+        Number of nearest cells of the neighbourhood (within `radius` if
+        given).
+    country : numpy.ndarray
+        Country of each cell to restrict the neighbourhoods to cells of the
+        same country, default None (no restriction).
+    """
+    if radius is None and k is None:
+        raise ValueError("Neighbourhood requires a radius or k")
+
+    lon, lat = np.asarray(lon, dtype=float), np.asarray(lat, dtype=float)
+    groups = [np.arange(len(lon))]
+    if country is not None:
+        country = np.asarray(country)
+        groups = [np.flatnonzero(country == c) for c in np.unique(country)]
+
+    # chord length on the unit sphere of the great-circle radius
+    chord = np.inf
+    if radius is not None:
+        chord = 2 * np.sin(min(radius / EARTH_RADIUS, np.pi) / 2)
+
+    neighbours = [np.empty(0, dtype=int)] * len(lon)
+    for group in groups:
+        points = unit_vectors(lon[group], lat[group])
+        tree = cKDTree(points)
+        if k is not None:
+            # distance of the k-th nearest cell, so all cells at the same
+            #   distance are candidates (ties are ordered by index)
+            count = min(k + 1, len(group))
+            distances, _ = tree.query(points, k=count)
+            distances = np.reshape(distances, (len(group), count))[:, -1]
+            bound = np.minimum(distances * (1 + 1e-9), chord)
+            candidates = tree.query_ball_point(points, bound)
+        else:
+            candidates = tree.query_ball_point(points, chord)
+
+        for i, cell_candidates in enumerate(candidates):
+            cell_candidates = np.asarray(cell_candidates, dtype=int)
+            cell_candidates = cell_candidates[cell_candidates != i]
+            # rounded to order cells at the same distance by index
+            distance = np.round(
+                np.linalg.norm(points[cell_candidates] - points[i], axis=1),
+                12,
+            )
+            order = np.lexsort((group[cell_candidates], distance))
+            if k is not None:
+                order = order[:k]
+            neighbours[group[i]] = group[cell_candidates[order]]
+
+    degrees = [len(cell_neighbours) for cell_neighbours in neighbours]
+    indices = np.concatenate(neighbours + [np.empty(0, dtype=int)])
+    return sparse.csr_matrix(
+        (
+            np.ones(len(indices)),
+            indices.astype(np.int32),
+            np.concatenate([[0], np.cumsum(degrees)]).astype(np.int32),
+        ),
+        shape=(len(lon), len(lon)),
+    )
+
+
+def cache_key(lon, lat, radius=None, k=None, country=None):
+    """Return the key of a neighbourhood in the cache: a hash of the grid
+    (and countries) and the parameters."""
+    digest = hashlib.sha256()
+    digest.update(f"{CACHE_VERSION}:{radius}:{k}".encode())
+    digest.update(np.ascontiguousarray(lon, dtype=float).tobytes())
+    digest.update(np.ascontiguousarray(lat, dtype=float).tobytes())
+    if country is not None:
+        digest.update("\0".join(map(str, country)).encode())
+    return digest.hexdigest()[:32]
+
+
+def build_neighbourhood(
+    lon, lat, radius=None, k=None, country=None, cache_dir=None
+):
+    """Return the neighbourhoods of the cells (see `neighbourhood_adjacency`),
+    read from the cache in `cache_dir` if built before, else built and
+    written to the cache."""
+    if cache_dir is None:
+        return neighbourhood_adjacency(lon, lat, radius, k, country)
+
+    key = cache_key(lon, lat, radius, k, country)
+    path = os.path.join(cache_dir, f"neighbourhood_{key}.npz")
+    if os.path.exists(path):
+        with np.load(path) as cached:
+            indices, indptr = cached["indices"], cached["indptr"]
+        return sparse.csr_matrix(
+            (np.ones(len(indices)), indices, indptr),
+            shape=(len(lon), len(lon)),
+        )
+
+    adjacency = neighbourhood_adjacency(lon, lat, radius, k, country)
+    os.makedirs(cache_dir, exist_ok=True)
+    # write to a temporary file first, so concurrent runs never read a
+    #   partially written cache file
+    temporary = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(temporary, indices=adjacency.indices, indptr=adjacency.indptr)
+    os.replace(temporary, path)
+    return adjacency
@@ -0,0 +1,241 @@
+"""FarmerPopulation class of inseeds_farmer_management"""
+
+import sys
+import numpy as np
+from scipy import sparse
+
+import inseeds.components.base as base
+from .domains import DomainDecomposition, latitude_domains
+
+# supported modes of scheduling the decisions of the farmers in a year
+DECISION_SCHEDULINGS = ["sequential", "synchronous"]
+
+
+class FarmerPopulation(base.Population):
+    """Population of all farmers holding their state as NumPy arrays.
+
+    The update of the population replaces the update of each single farmer
+    (`Farmer.update`) in `Component.update`.
+
+    Parameters
+    ----------
+    farmers : list
+        Farmers of the population.
+    scheduling : str
+        "sequential" (default): the farmers decide one after another in the
+        order of their average harvest date (`decision_order`) and see the
+        decisions of the farmers before them in the same year.
+        "synchronous": all farmers decide at once from a snapshot of the
+        state of their neighbours in the previous year, independent of any
+        order.
+    domains : int
+        Number of spatial domains (latitude bands) the population is split
+        into, each updated in a separate worker process (see
+        `DomainDecomposition`). Requires synchronous scheduling.
+    """
+
+    # variables of the neighbours seen from the previous year, exchanged
+    #   between the domains
+    exchanged_variables = ["cropyield", "soilc"]
+
+    def __init__(self, farmers, scheduling="sequential", domains=1):
+        super().__init__(farmers)
+
+        if scheduling not in DECISION_SCHEDULINGS:
+            raise ValueError(f"Decision scheduling {scheduling} not supported")
+        if domains > 1 and scheduling != "synchronous":
+            raise ValueError("Domains require synchronous decision scheduling")
+        self.scheduling = scheduling
+
+        # neighbourhood of the farmers as sparse adjacency matrix
+        #   (farmer, neighbour), the neighbours of a farmer are kept in the
+        #   order of its neighbourhood list
+        self.adjacency = neighbourhood_matrix(self.entities, self.index)
+
+        # index of the cell of each farmer in the world cell state
+        self.cell_index = np.array(
+            [farmer.cell_index for farmer in self.entities], dtype=int
+        )
+
+        # id of the cell of each farmer (key of its random streams)
+        self.cell_id = np.array(
+            [farmer.cell.cell_id for farmer in self.entities], dtype=int
+        )
+
+        # farmer and position in its neighbourhood of each neighbour
+        #   (entry of the adjacency matrix)
+        self._neighbour_farmer = np.repeat(np.arange(len(self)), self.degree)
+        self._neighbour_position = (
+            np.arange(self.adjacency.nnz)
+            - self.adjacency.indptr[self._neighbour_farmer]
+        )
+
+        self.decomposition = None
+        if domains > 1 and self.entities:
+            self.decompose(domains)
+            self.decomposition.start()
+
+    def decompose(self, n_domains):
+        """Split the population into `n_domains` latitude bands updated in
+        worker processes, with the population arrays in shared memory. Arrays
+        shared with the workers are to be created before they are started.
+        """
+        world = self.entities[0].world
+        cells = world.cell_indices(
+            [farmer.cell for farmer in self.entities], world.grid
+        )
+        self.decomposition = DomainDecomposition(
+            self,
+            latitude_domains(world.grid.lat.values[cells], n_domains),
+            exchanged={
+                name: self.variables[name].dtype
+                for name in self.exchanged_variables
+            },
+        )
+        # state of the cells of the farmers, provided to the workers
+        self._domain_cell_state = {
+            name: self.decomposition.shared_array(len(self), float)
+            for name in ["avg_hdate", "cropyield", "soilc"]
+        }
+
+    def close(self):
+        if self.decomposition is not None:
+            self.decomposition.close()
+            self.decomposition = None
+
+    @property
+    def degree(self):
+        """Return the number of neighbours of each farmer."""
+        return np.diff(self.adjacency.indptr)
+
+    def neighbours(self, i):
+        """Return the indices of the neighbours of farmer `i`."""
+        start, end = self.adjacency.indptr[i], self.adjacency.indptr[i + 1]
+        return self.adjacency.indices[start:end]
+
+    def neighbourhood_entries(self, farmers):
+        """Return the entries of the adjacency matrix (neighbours) of the
+        given farmers (sorted indices)."""
+        selected = np.zeros(len(self), dtype=bool)
+        selected[farmers] = True
+        return selected[self._neighbour_farmer]
+
+    def weighted_adjacency(self, weights, farmers=None):
+        """Return the adjacency matrix (rows) of the given farmers (sorted
+        indices), default all, with `weights` for each of their neighbours.
+        """
+        if farmers is None:
+            return sparse.csr_matrix(
+                (weights, self.adjacency.indices, self.adjacency.indptr),
+                shape=self.adjacency.shape,
+            )
+        entries = self.neighbourhood_entries(farmers)
+        indptr = np.concatenate([[0], np.cumsum(self.degree[farmers])])
+        return sparse.csr_matrix(
+            (weights, self.adjacency.indices[entries], indptr),
+            shape=(len(farmers), len(self)),
+        )
+
+    def neighbourhood_sum(self, values, farmers=None):
+        """Return the sum over the neighbourhood of the given farmers (sorted
+        indices), default all, of `values` given for each of their
+        neighbours (entries of `adjacency`).
+
+        The values are summed in the order of the neighbourhood the same way
+        as the built-in `sum` of Python floats (as used by `Farmer`), which
+        is compensated (Neumaier) summation since Python 3.12, so the
+        results are identical to the sums of each single farmer. Values of 0
+        do not change the sums.
+        """
+        if farmers is None:
+            farmers = np.arange(len(self))
+
+        if sys.version_info < (3, 12):
+            weighted = self.weighted_adjacency(values, farmers)
+            return weighted @ np.ones(len(self))
+
+        degree = self.degree[farmers]
+        farmer = np.repeat(np.arange(len(farmers)), degree)
+        position = self._neighbour_position[
+            self.neighbourhood_entries(farmers)
+        ]
+        total = np.zeros(len(farmers))
+        compensation = np.zeros(len(farmers))
+
+        # add the i-th neighbour of all farmers at once
+        for i in range(degree.max(initial=0)):
+            at = position == i
+            group, value = farmer[at], values[at]
+            current = total[group]
+            updated = current + value
+            compensation[group] += np.where(
+                np.abs(current) >= np.abs(value),
+                (current - updated) + value,
+                (value - updated) + current,
+            )
+            total[group] = updated
+
+        compensated = (compensation != 0) & np.isfinite(compensation)
+        total[compensated] += compensation[compensated]
+        return total
+
+    @property
+    def decision_order(self):
+        """Return the indices of the farmers in the order of their decisions
+        during the year (by the average harvest date of their cell)."""
+        return np.argsort(self.avg_hdate, kind="stable")
+
+    def farmer_cell_state(self):
+        """Return the state of the cells (average harvest date, crop yield
+        and soil carbon) of all farmers."""
+        cell_state = self.entities[0].world.cell_state
+        return {
+            name: values[self.cell_index]
+            for name, values in cell_state.items()
+        }
+
+    def update_state(self, cell_state, farmers=slice(None)):
+        """Update the average harvest date and the running averages of the
+        given farmers (default all) from the state of their cells."""
+        # update the average harvest date of the cells
+        self.avg_hdate[farmers] = cell_state["avg_hdate"]
+
+        # running average over strategy_switch_duration years to avoid rapid
+        #    switching by weather fluctuations
+        weight = 1 / self.strategy_switch_duration[farmers]
+        cropyield, soilc = self.cropyield[farmers], self.soilc[farmers]
+        self.cropyield[farmers] = (1 - weight) * cropyield + weight * (
+            cell_state["cropyield"]
+        )
+        self.soilc[farmers] = (1 - weight) * soilc + weight * (
+            cell_state["soilc"]
+        )
+
+    def update(self, t):
+        super().update(t)
+
+        if not self.entities:
+            return
+        self.update_state(self.farmer_cell_state())
+
+
+def neighbourhood_matrix(farmers, index):
+    """Return the neighbourhoods of the farmers as sparse adjacency matrix
+    (CSR), with the neighbours in the order of the neighbourhood lists."""
+    degrees = [len(farmer.neighbourhood) for farmer in farmers]
+    indices = np.array(
+        [
+            index[neighbour]
+            for farmer in farmers
+            for neighbour in farmer.neighbourhood
+        ],
+        dtype=np.int32,
+    )
+    return sparse.csr_matrix(
+        (
+            np.ones(len(indices)),
+            indices,
+            np.concatenate([[0], np.cumsum(degrees)]).astype(np.int32),
+        ),
+        shape=(len(farmers), len(farmers)),
+    )
@@ -0,0 +1,45 @@
+"""Calendar of the decisions of the farmers."""
+
+import numpy as np
+
+
+class DecisionCalendar:
+    """Bucket calendar of farmers (population indices) by the year of their
+    next decision, so the farmers deciding in a year are found without
+    visiting all farmers.
+    """
+
+    def __init__(self):
+        self._buckets = {}
+
+    def __len__(self):
+        return sum(
+            len(farmers)
+            for bucket in self._buckets.values()
+            for farmers in bucket
+        )
+
+    def clear(self):
+        """Remove all farmers from the calendar."""
+        self._buckets = {}
+
+    def schedule(self, farmers, years):
+        """Schedule the next decision of the farmers in the given years."""
+        farmers = np.asarray(farmers, dtype=int)
+        years = np.asarray(years, dtype=int)
+        if not len(farmers):
+            return
+        order = np.argsort(years, kind="stable")
+        farmers, years = farmers[order], years[order]
+        starts = np.flatnonzero(np.diff(years, prepend=years[0] - 1))
+        for year, group in zip(years[starts], np.split(farmers, starts[1:])):
+            self._buckets.setdefault(year.item(), []).append(group)
+
+    def due(self, t):
+        """Remove and return the farmers (sorted) with their next decision
+        in year `t` or before."""
+        years = [year for year in self._buckets if year <= t]
+        groups = [
+            farmers for year in years for farmers in self._buckets.pop(year)
+        ]
+        return np.unique(np.concatenate(groups + [np.array([], dtype=int)]))
@@ -1,5 +1,7 @@
 """The inseeds_farmer_mnagement.world class."""
 
+import numpy as np
+
 import inseeds.components.base as base
 
 
@@ -10,12 +12,75 @@ class World(base.World):
         """Initialize an instance of World."""
         super().__init__(**kwargs)
 
+        # cells and farmers of the world by entity type
+        self.registry = base.EntityRegistry()
+
+        # state of all cells derived from the LPJmL output and the bands of
+        #   the crops (of the cftmap) to derive it
+        self._cell_state = None
+        self._crop_bands = None
+
     @property
     def farmers(self):
-        """Return the set of all farmers."""
-        farmers = {
-            farmer
-            for farmer in self.individuals
-            if farmer.__class__.__name__ == "Farmer"  # noqa
+        """Return the set of all farmers (in a stable order)."""
+        return self.registry.entities("Farmer")
+
+    def cell_indices(self, cells, data=None):
+        """Return the indices of the given cells in the world output or in
+        the given `data` (e.g. the world input)."""
+        if data is None:
+            data = self.output
+        return data.get_index("cell").get_indexer(
+            [cell.cell_id for cell in cells]
+        )
+
+    @property
+    def cell_state(self):
+        """Return the state of all cells (average harvest date, crop yield
+        and soil carbon) as arrays indexed by `cell_indices`."""
+        if self._cell_state is None:
+            self.update_cell_state()
+        return self._cell_state
+
+    def update_cell_state(self):
+        """Derive the state of all cells at once from the world output, to
+        be called after each read of the LPJmL output.
+
+        The average harvest date is weighted by the crop fractions of the
+        crops in the cftmap (365 without crops), crop yield and soil carbon
+        default to 1e-3 if 0.
+        """
+        if self._crop_bands is None:
+            self._crop_bands = [
+                i
+                for i, item in enumerate(self.output.hdate.band.values)
+                if any(x in item for x in self.model.config.cftmap)
+            ]
+
+        # values of each cell (bands and time) as contiguous rows, so the
+        #   sums over the rows equal the sums over the single cells
+        def cell_values(name, bands=slice(None)):
+            values = self.output[name].transpose("cell", ...).values
+            return np.ascontiguousarray(
+                values[:, bands].reshape(len(values), -1)
+            )
+
+        hdate = cell_values("hdate")
+        cftfrac = cell_values("cftfrac", self._crop_bands)
+        crop_area = cftfrac.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            avg_hdate = np.where(
+                crop_area == 0,
+                365,
+                np.multiply(hdate, cftfrac, dtype=float).sum(axis=1)
+                / crop_area,
+            )
+
+        cropyield = cell_values("harvestc").mean(axis=1)
+        soilc = cell_values("soilc_agr_layer", 0)[:, 0]
+
+        self._cell_state = {
+            "avg_hdate": avg_hdate,
+            "cropyield": np.where(cropyield == 0, 1e-3, cropyield),
+            "soilc": np.where(soilc == 0, 1e-3, soilc),
         }
-        return farmers
@@ -1,3 +1,4 @@
 from pycopanlpjml import Cell
 from pycopanlpjml import World
 from .component import Component
+from .replay import ReplayStore, LPJmLRecorder, LPJmLReplay, TillageResponse
@@ -2,15 +2,36 @@ import sys
 import pickle
 import pycopanlpjml as lpjml
 
+from .replay import LPJmLRecorder, LPJmLReplay
+
 
 # mixin for testing
 class Component(lpjml.Component):
 
-    def __init__(self, test_path=None, **kwargs):
-        """Initialize an instance of LPJmLComponent."""
+    def __init__(self, test_path=None, record=None, replay=None, **kwargs):
+        """Initialize an instance of LPJmLComponent.
+
+        Parameters
+        ----------
+        record : str
+            Directory of a store to record the LPJmL coupling into (see
+            `LPJmLRecorder`), default None.
+        replay : str or LPJmLReplay
+            (Directory of the) store of a recorded LPJmL coupling to be
+            replayed instead of running LPJmL (see `LPJmLReplay`), default
+            None.
+        """
+        if replay is not None:
+            if not isinstance(replay, LPJmLReplay):
+                replay = LPJmLReplay(replay)
+            kwargs["lpjml"] = replay
+
         super().__init__(**kwargs)
 
-        if hasattr(sys, "_called_from_test"):
+        if record is not None:
+            self.lpjml = LPJmLRecorder(self.lpjml, record)
+
+        if hasattr(sys, "_called_from_test") and replay is None:
             # Define new methods for self.lpjml
             def read_input():
                 """Read the input data from the LPJmL output file."""
@@ -28,3 +49,20 @@ class Component(lpjml.Component):
             self.lpjml.read_input = read_input
             self.lpjml.read_output = read_output
             self.lpjml.read_historic_output = read_output
+
+    def update_lpjml(self, t):
+        if not (
+            isinstance(self.lpjml, LPJmLReplay)
+            and hasattr(sys, "_called_from_test")
+        ):
+            super().update_lpjml(t)
+            return
+
+        # exchange with the replayed LPJmL coupling also when testing, as
+        #   the replay does not need a running LPJmL
+        called_from_test = sys._called_from_test
+        del sys._called_from_test
+        try:
+            super().update_lpjml(t)
+        finally:
+            sys._called_from_test = called_from_test
@@ -0,0 +1,312 @@
+"""Recording and offline replay of the LPJmL coupling."""
+
+import os
+import copy
+import pickle
+import numpy as np
+import pandas as pd
+import xarray as xr
+from pycoupler.coupler import LPJmLCoupler
+from pycoupler.data import LPJmLDataSet
+
+
+class ReplayStore:
+    """On-disk store of the data exchanged with LPJmL in a coupled run.
+
+    The static data (coupler state incl. grid, country and config, the
+    initial input and the historic output) is written once as pickle files,
+    the outputs read and the inputs sent in each coupled year are written
+    as one NumPy npz file (chunk) per year, so a single year is read without
+    reading any other year.
+
+    Parameters
+    ----------
+    path : str
+        Directory of the store.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def _file(self, name, year=None):
+        if year is None:
+            return os.path.join(self.path, f"{name}.pkl")
+        return os.path.join(self.path, name, f"{year}.npz")
+
+    @property
+    def years(self):
+        """Return the years with a recorded output (sorted)."""
+        directory = os.path.join(self.path, "output")
+        if not os.path.isdir(directory):
+            return []
+        return sorted(
+            int(file_name.removesuffix(".npz"))
+            for file_name in os.listdir(directory)
+            if file_name.endswith(".npz")
+        )
+
+    def write(self, name, data):
+        """Write static data (pickled)."""
+        os.makedirs(self.path, exist_ok=True)
+        with open(self._file(name), "wb") as out:
+            pickle.dump(data, out, pickle.HIGHEST_PROTOCOL)
+
+    def read(self, name):
+        """Read static data."""
+        with open(self._file(name), "rb") as inp:
+            return pickle.load(inp)
+
+    def write_year(self, name, year, data):
+        """Write the variables of the `data` (dict of arrays or dataset) of
+        a year to the chunk `name` ("output" or "input") of the year."""
+        path = self._file(name, year)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to a temporary file first, so an interrupted recording never
+        #   leaves a partially written year
+        temporary = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(
+            temporary,
+            **{key: np.asarray(values) for key, values in data.items()},
+        )
+        os.replace(temporary, path)
+
+    def read_year(self, name, year):
+        """Read the variables of the chunk `name` of a year (dict of arrays),
+        None if not recorded."""
+        path = self._file(name, year)
+        if not os.path.isfile(path):
+            return None
+        with np.load(path) as chunk:
+            return {key: chunk[key] for key in chunk.files}
+
+
+class LPJmLRecorder:
+    """Coupler recording the data exchanged with LPJmL into a `ReplayStore`
+    while passing it through, to be replayed with `LPJmLReplay`.
+
+    Parameters
+    ----------
+    coupler : pycoupler.coupler.LPJmLCoupler
+        Coupler connected to the running LPJmL simulation.
+    store : str or ReplayStore
+        (Directory of the) store to record into.
+    """
+
+    def __init__(self, coupler, store):
+        self.coupler = coupler
+        if not isinstance(store, ReplayStore):
+            store = ReplayStore(store)
+        self.store = store
+        # state of the coupler without the connection (see
+        #   LPJmLCoupler.__getstate__)
+        self.store.write("coupler", coupler.__getstate__())
+
+    def __getattr__(self, name):
+        if name == "coupler":
+            raise AttributeError(name)
+        return getattr(self.coupler, name)
+
+    def read_input(self, *args, **kwargs):
+        lpjml_input = self.coupler.read_input(*args, **kwargs)
+        self.store.write("input", lpjml_input)
+        return lpjml_input
+
+    def read_historic_output(self, *args, **kwargs):
+        output = self.coupler.read_historic_output(*args, **kwargs)
+        self.store.write("historic_output", output)
+        return output
+
+    def send_input(self, input_dict, year):
+        self.store.write_year("input", year, input_dict)
+        return self.coupler.send_input(input_dict, year)
+
+    def read_output(self, year, to_xarray=True):
+        output = self.coupler.read_output(year, to_xarray=to_xarray)
+        self.store.write_year("output", year, output)
+        return output
+
+
+class LPJmLReplay(LPJmLCoupler):
+    """Coupler replaying the LPJmL outputs recorded in a coupled run (see
+    `LPJmLRecorder`) instead of connecting to LPJmL, e.g. for fast sweeps of
+    the parameters of the social model.
+
+    The outputs of a year are independent of the inputs sent, unless a
+    `response` adjusts them to the difference of the sent inputs to the
+    recorded inputs (e.g. `TillageResponse`).
+
+    Parameters
+    ----------
+    store : str or ReplayStore
+        (Directory of the) store of the recorded run.
+    response : callable
+        Called with the outputs (dict of arrays, modified in place), the sent
+        and the recorded inputs (dicts of arrays) of each year, default None.
+        A `setup` method of the response is called with the replay first,
+        e.g. to read the layout of the recorded data.
+    """
+
+    def __init__(self, store, response=None):
+        if not isinstance(store, ReplayStore):
+            store = ReplayStore(store)
+        self.store = store
+        self.__dict__.update(self.store.read("coupler"))
+        self.response = response
+        self._sent_input = None
+        if hasattr(response, "setup"):
+            response.setup(self)
+
+    @property
+    def output_templates(self):
+        """Return the templates of the (non static) outputs by name."""
+        return {
+            self._output_ids[key]: template
+            for key, template in self._output_templates.items()
+            if key not in self._static_ids
+        }
+
+    def code_to_name(self, to_iso_alpha_3=False):
+        """Keep the countries as recorded (converted before recording)."""
+        pass
+
+    def read_input(self, *args, **kwargs):
+        return self.store.read("input")
+
+    def read_historic_output(self, to_xarray=True):
+        # the coupled years follow the historic years
+        self._sim_year = self.config.start_coupling
+        return self.store.read("historic_output")
+
+    def send_input(self, input_dict, year):
+        self._sent_input = {
+            key: np.array(values) for key, values in input_dict.items()
+        }
+        self._year_send_input = year
+
+    def read_output(self, year, to_xarray=True):
+        output = self.store.read_year("output", year)
+        if output is None:
+            raise ValueError(f"No output recorded for year {year}")
+
+        if self.response is not None and self._sent_input is not None:
+            recorded_input = self.store.read_year("input", year)
+            if recorded_input is not None:
+                self.response(output, self._sent_input, recorded_input)
+
+        self._year_read_output = year
+        self._sim_year = year + 1
+        if not to_xarray:
+            return output
+
+        # fill the output templates of the coupler as LPJmL outputs
+        templates = self.output_templates
+        time = pd.DatetimeIndex([pd.Timestamp(f"{year}-12-31")])
+        lpjml_output = {}
+        for name, values in output.items():
+            lpjml_output[name] = copy.deepcopy(templates[name])
+            lpjml_output[name].coords["time"] = time
+            lpjml_output[name].values[:] = values
+        return LPJmLDataSet(lpjml_output)
+
+    def close(self):
+        pass
+
+
+class TillageResponse:
+    """Simple response of the replayed crop yield and soil carbon to tillage
+    differing from the recorded run.
+
+    For cells without tillage where the recorded run tilled (and vice versa),
+    the crop yield of the year is changed by `yield_change`, the soil carbon
+    by `soilc_change` for each year of difference (accumulated, as the soil
+    carbon is a stock).
+
+    The name of the tillage input is taken from the coupling map of the
+    recorded run, the layout (dimensions) of the input and the outputs from
+    the recorded input and output templates (see `setup`). A tillage input
+    with bands is applied to the output bands of the same index.
+
+    Parameters
+    ----------
+    yield_change : float
+        Relative change of the crop yield without tillage.
+    soilc_change : float
+        Relative change of the soil carbon per year without tillage.
+    input_name : str
+        Name of the LPJmL tillage input, default None (from the coupling
+        map).
+    yield_name : str
+        Name of the LPJmL crop yield output, default "harvestc".
+    soilc_name : str
+        Name of the LPJmL soil carbon output, default "soilc_agr_layer".
+    """
+
+    def __init__(
+        self,
+        yield_change=-0.05,
+        soilc_change=0.005,
+        input_name=None,
+        yield_name="harvestc",
+        soilc_name="soilc_agr_layer",
+    ):
+        self.yield_change = yield_change
+        self.soilc_change = soilc_change
+        self.input_name = input_name
+        self.yield_name = yield_name
+        self.soilc_name = soilc_name
+        self._dims = None
+        self._soilc_factor = 0
+
+    @staticmethod
+    def _layout(dims):
+        """Return the dimensions without the variable names of the bands,
+        e.g. "band" for "band (harvestc)"."""
+        return tuple(dim.split(" ")[0] for dim in dims)
+
+    def setup(self, replay):
+        """Take the name of the tillage input and the layout of the input and
+        the outputs from the recorded run of the `replay`."""
+        if self.input_name is None:
+            coupling_map = replay.config.coupled_config.coupling_map
+            input_name = coupling_map.to_dict()["tillage"]
+            if isinstance(input_name, list):
+                input_name = input_name[0]
+            self.input_name = input_name
+
+        templates = replay.output_templates
+        self._dims = {
+            name: self._layout(templates[name].dims)
+            for name in [self.yield_name, self.soilc_name]
+        }
+        self._dims[self.input_name] = self._layout(
+            replay.read_input()[self.input_name].dims
+        )
+
+    def __call__(self, output, sent_input, recorded_input):
+        if self._dims is None:
+            raise ValueError(
+                "TillageResponse not set up, pass it to LPJmLReplay"
+            )
+        # 1 for cells without tillage where the recorded run tilled
+        difference = xr.DataArray(
+            recorded_input[self.input_name].astype(float)
+            - sent_input[self.input_name],
+            dims=self._dims[self.input_name],
+        )
+        if difference.sizes.get("band") == 1:
+            # same tillage for all bands of a cell
+            difference = difference.squeeze("band")
+
+        self._soilc_factor = (
+            self._soilc_factor + self.soilc_change * difference
+        )
+        for name, factor in [
+            (self.yield_name, 1 + self.yield_change * difference),
+            (self.soilc_name, 1 + self._soilc_factor),
+        ]:
+            dims = self._dims[name]
+            output[name] = (
+                (xr.DataArray(output[name], dims=dims) * factor)
+                .transpose(*dims)
+                .values
+            )
@@ -2,26 +2,79 @@ import os
 import argparse
 
 from pycoupler.coupler import LPJmLCoupler
+from inseeds.components.lpjml import LPJmLReplay, TillageResponse
 from inseeds.models.regenerative_tillage import Model
 
 
-def run_inseeds(config_file):
-    """Run the INSEEDS model with the given configuration file"""
-    if not os.path.exists(config_file):
-        raise FileNotFoundError(f"{config_file} does not exist")
+def run_inseeds(
+    config_file=None,
+    record=None,
+    replay=None,
+    yield_change=None,
+    soilc_change=None,
+):
+    """Run the INSEEDS model with the given configuration file, recording
+    the LPJmL coupling into the store `record` if given, or without LPJmL
+    from the recorded store `replay`, with the replayed outputs responding
+    to the tillage by `yield_change` and `soilc_change` if given (see
+    `TillageResponse`)"""
+    if replay is not None:
+        changes = {
+            key: value
+            for key, value in dict(
+                yield_change=yield_change, soilc_change=soilc_change
+            ).items()
+            if value is not None
+        }
+        response = TillageResponse(**changes) if changes else None
+        model = Model(replay=LPJmLReplay(replay, response=response))
+    else:
+        if config_file is None or not os.path.exists(config_file):
+            raise FileNotFoundError(f"{config_file} does not exist")
+        model = Model(config_file=config_file, record=record)
 
-    model = Model(config_file=config_file)
-
-    for year in model.lpjml.get_sim_years():
-        model.update(year)
+    try:
+        for year in model.lpjml.get_sim_years():
+            model.update(year)
+    finally:
+        # write the output of a simulation stopped early
+        model.close_output_table()
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("config_file", help="Path to the configuration file")
+    parser.add_argument(
+        "config_file", nargs="?", help="Path to the configuration file"
+    )
+    parser.add_argument(
+        "--record", help="Directory to record the LPJmL coupling into"
+    )
+    parser.add_argument(
+        "--replay", help="Directory of a recorded LPJmL coupling to replay"
+    )
+    parser.add_argument(
+        "--yield-change",
+        type=float,
+        help="Relative change of the replayed crop yield without tillage",
+    )
+    parser.add_argument(
+        "--soilc-change",
+        type=float,
+        help="Relative change per year of the replayed soil carbon without "
+        "tillage",
+    )
     args = parser.parse_args()
 
-    run_inseeds(args.config_file)
+    run_inseeds(
+        args.config_file,
+        record=args.record,
+        replay=args.replay,
+        yield_change=args.yield_change,
+        soilc_change=args.soilc_change,
+    )
 
 # execute program via
 # python inseeds.py /path/to/config_coupled_fn.json
+# python inseeds.py /path/to/config_coupled_fn.json --record /path/to/store
+# python inseeds.py --replay /path/to/store
+# python inseeds.py --replay /path/to/store --yield-change -0.05
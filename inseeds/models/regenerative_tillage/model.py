@@ -14,7 +14,7 @@ class Farmer(tillage.Farmer):
     """Farmer entity type."""
 
     output_variables = base.Output(
-        aft_id=Variable("AFT ID", "unique identifier for agent"),
+        aft_id=Variable("AFT ID", "unique identifier for agent", datatype=int),
         avg_hdate=Variable(
             "average harvest date",
             "weighted average harvest date of grown crops (by crop area)",
@@ -66,8 +66,9 @@ class Farmer(tillage.Farmer):
     )
 
 
-class Cell(lpjml.Cell, farming.Cell):
-    """Cell entity type."""
+class Cell(farming.Cell, lpjml.Cell):
+    """Cell entity type (the farming cell first to register with the world
+    once initialized, as the farmers do)."""
 
     pass
 
@@ -87,8 +88,9 @@ class Model(lpjml.Component, farming.Component):
     description = "InSEEDS farmer management model representing only social \
     dynamics and decision-making on the basis of the TPB"
 
-    def __init__(self, **kwargs):
-        """Initialize an instance of World."""
+    def __init__(self, checkpoint=None, **kwargs):
+        """Initialize an instance of World, resumed from a `checkpoint`
+        file if given (see `from_checkpoint`)."""
         # Initialize the parent classes first
         super().__init__(**kwargs)
 
@@ -110,16 +112,52 @@ class Model(lpjml.Component, farming.Component):
         self.init_cells(cell_class=Cell)
 
         # initialize farmers
-        self.init_farmers(farmer_class=Farmer)
+        self.init_farmers(
+            farmer_class=Farmer,
+            population_class=tillage.FarmerPopulation,
+            checkpoint=checkpoint,
+        )
 
-        self.write_output_table(
-            init=True,
-            file_format=self.config.coupled_config.output_settings.file_format,
+        if checkpoint is not None:
+            # remove the output written after the checkpoint
+            output_settings = self.output_settings
+            self.truncate_output(
+                self.resumed_year + 1,
+                file_format=output_settings["file_format"],
+                compression=output_settings["compression"],
+            )
+
+    @property
+    def output_settings(self):
+        """Return the configured settings for writing the output table."""
+        output_settings = self.config.coupled_config.output_settings
+        return dict(
+            file_format=output_settings.file_format,
+            layout=getattr(output_settings, "layout", "long"),
+            background=getattr(output_settings, "background_writer", False),
+            max_queue_size=getattr(output_settings, "writer_queue_size", 2),
+            compression=getattr(output_settings, "compression", None),
+            flush_interval=getattr(output_settings, "flush_interval", 1),
         )
 
     def update(self, t):
         super().update(t)
+        # output of the year after the decisions of the farmers, written
+        #   once per year, the output is initialized with the first year
         self.write_output_table(
-            file_format=self.config.coupled_config.output_settings.file_format
+            init=t == self.config.start_coupling, **self.output_settings
         )
         self.update_lpjml(t)
+
+        # checkpoint every checkpoint_interval years of the coupling
+        interval = getattr(
+            self.config.coupled_config, "checkpoint_interval", None
+        )
+        if interval and (t - self.config.start_coupling + 1) % interval == 0:
+            self.save_checkpoint(t)
+
+        # close output file at the end of the simulation
+        if t == self.config.lastyear:
+            self.close_output_table()
+            if self.farmer_population is not None:
+                self.farmer_population.close()
@@ -0,0 +1,381 @@
+"""Reading of InSEEDS output tables.
+
+`read_output` reads the output of a simulation with column projection and
+filters (years, cells, countries, variables, entity type) that are pushed
+down to the Parquet reader, so only the requested parts of a large output
+are loaded. It returns either a tidy Arrow table or an `xarray.Dataset`
+indexed by year and cell with one data variable per output variable.
+
+Examples
+--------
+>>> from inseeds.reader import read_output
+>>> soilc = read_output(
+...     "./simulations/output/coupled_global",
+...     variables=["soil organic carbon"],
+...     countries=["NLD"],
+...     as_xarray=True,
+... )
+"""
+
+import os
+import functools
+import operator
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as csv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import xarray as xr
+
+# columns of the output tables that are not output variables
+INDEX_COLUMNS = [
+    "year",
+    "cell",
+    "lon",
+    "lat",
+    "country",
+    "area [km2]",
+    "entity",
+    "entity_id",
+]
+
+# columns of the long and normalized layout
+LONG_COLUMNS = ["variable", "value", "unit"]
+
+# types of columns that can not be inferred reliably from (CSV) blocks
+COLUMN_TYPES = {
+    "year": pa.int64(),
+    "cell": pa.int64(),
+    "entity_id": pa.int64(),
+    "country": pa.string(),
+    "entity": pa.string(),
+    "variable": pa.string(),
+    "unit": pa.string(),
+}
+
+
+def read_table(file_name, columns=None, filter=None):
+    """Read an InSEEDS output table (Parquet or CSV file) as Arrow table.
+
+    Parameters
+    ----------
+    file_name : str
+        Path to the output file or Parquet dataset (directory of yearly
+        files), format is derived from the file extension.
+    columns : list, optional
+        Columns to read, default all.
+    filter : pyarrow.compute.Expression, optional
+        Filter of the rows to read. For Parquet files it is pushed down to
+        skip row groups, CSV files are filtered block by block while
+        streaming.
+
+    Returns
+    -------
+    pyarrow.Table
+        The output table.
+    """
+    if str(file_name).endswith(".parquet"):
+        return pq.read_table(
+            file_name, columns=columns, filters=filter, memory_map=True
+        )
+    elif _is_csv(file_name):
+        reader = csv.open_csv(
+            file_name,
+            convert_options=csv.ConvertOptions(
+                include_columns=columns, column_types=COLUMN_TYPES
+            ),
+        )
+        batches = [
+            batch if filter is None else batch.filter(filter)
+            for batch in reader
+        ]
+        return pa.Table.from_batches(batches, schema=reader.schema)
+    else:
+        raise ValueError(f"Output file format of {file_name} not supported")
+
+
+def read_schema(file_name):
+    """Read the schema of an InSEEDS output table (Parquet or CSV file)."""
+    if str(file_name).endswith(".parquet"):
+        if os.path.isdir(file_name):
+            return ds.dataset(file_name, format="parquet").schema
+        return pq.read_schema(file_name)
+    elif _is_csv(file_name):
+        return csv.open_csv(
+            file_name,
+            convert_options=csv.ConvertOptions(column_types=COLUMN_TYPES),
+        ).schema
+    else:
+        raise ValueError(f"Output file format of {file_name} not supported")
+
+
+def join_entities(data, entities):
+    """Join the yearly output of the normalized layout with the static
+    entities table, which results in the long layout (without units) with
+    the static output variables as additional columns.
+
+    Parameters
+    ----------
+    data : pyarrow.Table
+        Yearly output table (inseeds_data) of the normalized layout with
+        year, entity_id, variable and value.
+    entities : pyarrow.Table
+        Static entities table (inseeds_entities) with entity_id, entity,
+        location and static output variables.
+
+    Returns
+    -------
+    pyarrow.Table
+        The joined table sorted by year and entity_id.
+    """
+    table = data.join(entities, keys="entity_id", join_type="left outer")
+    columns = (
+        ["year", "entity_id"]
+        + [name for name in entities.column_names if name != "entity_id"]
+        + ["variable", "value"]
+    )
+    return table.select(columns).sort_by(
+        [("year", "ascending"), ("entity_id", "ascending")]
+    )
+
+
+def read_output(
+    file_name,
+    years=None,
+    cells=None,
+    countries=None,
+    variables=None,
+    entity=None,
+    as_xarray=False,
+):
+    """Read the output of an InSEEDS simulation.
+
+    Supports the long, wide and normalized layout of Parquet and CSV
+    output files as well as gridded NetCDF output files.
+
+    Parameters
+    ----------
+    file_name : str
+        Path to the output file or to the output directory of a simulation
+        holding an inseeds_data file.
+    years : list, optional
+        Years to read, default all.
+    cells : list, optional
+        LPJmL cell ids to read, default all.
+    countries : list, optional
+        Countries (as written to the output) to read, default all.
+    variables : list, optional
+        Output variables to read by their (long) names as written to the
+        output, default all.
+    entity : str, optional
+        Entity type to read, e.g. "Farmer", default all.
+    as_xarray : bool
+        Return an `xarray.Dataset` indexed by year and cell with one data
+        variable per output variable instead of a tidy Arrow table.
+        NetCDF output is always returned as (lazily opened) Dataset.
+
+    Returns
+    -------
+    pyarrow.Table or xarray.Dataset
+        The selected output.
+    """
+    file_name = _output_file(file_name)
+
+    if file_name.endswith(".nc"):
+        return _read_gridded_output(
+            file_name, years, cells, countries, variables, entity
+        )
+
+    names = read_schema(file_name).names
+    filters = {"year": years, "cell": cells, "country": countries}
+    filters["entity"] = [entity] if entity is not None else None
+
+    if "entity_id" in names and "cell" not in names:
+        # normalized layout: select entities from the entities table
+        entities_file_name = file_name.replace(
+            "inseeds_data", "inseeds_entities"
+        )
+        entities = read_table(
+            entities_file_name,
+            filter=_filter(
+                {
+                    key: filters[key]
+                    for key in ["cell", "country", "entity"]
+                    if filters[key] is not None
+                }
+            ),
+        )
+        data_filters = {"year": years, "variable": variables}
+        if any(
+            filters[key] is not None for key in ["cell", "country", "entity"]
+        ):
+            data_filters["entity_id"] = entities.column("entity_id")
+
+        table = join_entities(
+            read_table(file_name, filter=_filter(data_filters)), entities
+        )
+        if as_xarray:
+            return _long_to_xarray(table)
+        return table
+
+    elif "variable" in names:
+        # long layout
+        filters["variable"] = variables
+        table = read_table(file_name, filter=_filter(filters))
+        if as_xarray:
+            return _long_to_xarray(table)
+        return table
+
+    else:
+        # wide layout: variables are selected as columns
+        if variables is not None:
+            columns = [
+                name
+                for name in names
+                if name in INDEX_COLUMNS or name in variables
+            ]
+        else:
+            columns = None
+        table = read_table(file_name, columns=columns, filter=_filter(filters))
+        if as_xarray:
+            return _wide_to_xarray(table)
+        return table
+
+
+def _output_file(file_name):
+    """Return the output file (or Parquet dataset) of an output directory."""
+    if not os.path.isdir(file_name) or str(file_name).endswith(".parquet"):
+        return str(file_name)
+    for extension in ["parquet", "csv", "csv.gz", "csv.zst", "nc"]:
+        output_file = os.path.join(file_name, f"inseeds_data.{extension}")
+        if os.path.exists(output_file):
+            return output_file
+    raise FileNotFoundError(f"No inseeds_data output file in {file_name}")
+
+
+def _is_csv(file_name):
+    """Check for a (compressed) CSV file, decompressed while reading."""
+    return str(file_name).endswith((".csv", ".csv.gz", ".csv.zst"))
+
+
+def _filter(filters):
+    """Combine the given column filters (column: values) to an expression."""
+    expressions = [
+        pc.field(column).isin(
+            values if isinstance(values, pa.ChunkedArray) else list(values)
+        )
+        for column, values in filters.items()
+        if values is not None
+    ]
+    if not expressions:
+        return None
+    return functools.reduce(operator.and_, expressions)
+
+
+def _assign_cell_coords(dataset, table, static_variables=()):
+    """Assign the static cell information of a table (location and static
+    output variables) as cell coordinates."""
+    columns = ["cell"] + [
+        name
+        for name in table.column_names
+        if name in ["lon", "lat", "country", "area [km2]"]
+        or name in static_variables
+    ]
+    cells = (
+        table.select(columns)
+        .to_pandas()
+        .drop_duplicates("cell")
+        .set_index("cell")
+        .reindex(dataset.cell.values)
+    )
+    return dataset.assign_coords(
+        {name: ("cell", np.asarray(cells[name])) for name in cells.columns}
+    )
+
+
+def _long_to_xarray(table):
+    """Reshape a long layout table to a Dataset (year, cell)."""
+    df = table.select(["year", "cell", "variable", "value"]).to_pandas()
+    df["variable"] = df["variable"].astype(str)
+    if df.duplicated(["year", "cell", "variable"]).any():
+        raise ValueError(
+            "Output variables are not unique per cell, select an entity"
+        )
+    dataset = (
+        df.set_index(["year", "cell", "variable"])["value"]
+        .unstack("variable")
+        .to_xarray()
+    )
+    # static output variables of the normalized layout
+    static_variables = [
+        name
+        for name in table.column_names
+        if name not in INDEX_COLUMNS and name not in LONG_COLUMNS
+    ]
+    dataset = _assign_cell_coords(dataset, table, static_variables)
+
+    if "unit" in table.column_names:
+        units = (
+            table.select(["variable", "unit"])
+            .to_pandas()
+            .astype(str)
+            .drop_duplicates("variable")
+            .set_index("variable")["unit"]
+        )
+        for variable in dataset.data_vars:
+            if units.get(variable) not in [None, "None", "nan"]:
+                dataset[variable].attrs["units"] = units[variable]
+    return dataset
+
+
+def _wide_to_xarray(table):
+    """Reshape a wide layout table to a Dataset (year, cell)."""
+    variables = [
+        name
+        for name in table.column_names
+        if name not in INDEX_COLUMNS and name not in LONG_COLUMNS
+    ]
+    df = table.select(["year", "cell"] + variables).to_pandas()
+    if df.duplicated(["year", "cell"]).any():
+        raise ValueError(
+            "Output rows are not unique per cell, select an entity"
+        )
+    dataset = df.set_index(["year", "cell"]).to_xarray()
+    dataset = _assign_cell_coords(dataset, table)
+
+    for variable in variables:
+        metadata = table.schema.field(variable).metadata or {}
+        if b"unit" in metadata:
+            dataset[variable].attrs["units"] = metadata[b"unit"].decode()
+    return dataset
+
+
+def _read_gridded_output(
+    file_name, years, cells, countries, variables, entity
+):
+    """Open gridded (NetCDF) output lazily and select from it."""
+    if cells is not None or countries is not None:
+        raise ValueError("Gridded output can not be selected by cells")
+
+    dataset = xr.open_dataset(file_name)
+    if entity is not None:
+        dataset = dataset[
+            [
+                name
+                for name in dataset.data_vars
+                if dataset[name].attrs.get("entity") == entity.lower()
+            ]
+        ]
+    if variables is not None:
+        dataset = dataset[
+            [
+                name
+                for name in dataset.data_vars
+                if name in variables
+                or dataset[name].attrs.get("long_name") in variables
+            ]
+        ]
+    if years is not None:
+        dataset = dataset.sel(time=dataset.time.dt.year.isin(list(years)))
+    return dataset
@@ -2,16 +2,14 @@ import os
 import glob
 import imageio
 import ssl
-import pandas as pd
 import numpy as np
-import xarray as xr
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 from matplotlib.colors import ListedColormap
 import cartopy.crs as ccrs
 import cartopy.feature as cfeature
 
-from pycoupler.data import read_data
+from inseeds.reader import read_output
 
 ssl._create_default_https_context = ssl._create_unverified_context
 
@@ -20,82 +18,42 @@ output_path = "./simulations/output/coupled_global"
 plot_dir = "./plots"
 
 
-all_output = pd.read_csv(f"{output_path}/inseeds.csv")
-ts = pd.pivot_table(
-    all_output, values="value", index=["year", "cell"], columns=["variable"]
-)
-
-
-# read grid information to map table values
-grid = read_data(f"{output_path}/grid.nc4").astype("float32")
-
-
-# read soil carbon as template for output
-soilc = read_data(f"{output_path}/soilc.nc4")
-output = soilc.where(
-    soilc.time >= min(ts.index.get_level_values("year").to_list()), drop=True
-)
-
-lu_cells = all_output["cell"].unique()
-# lu_cells.sort()
-
-# Filter out NaN values from 'cell' variable
-na_check = np.where(
-    grid["cellid"].values == -999999, np.nan, grid["cellid"].values
-)
-
-# Check if each value is in lu_cells
-valid_cells = np.isin(na_check, lu_cells)
-# valid_cells = np.logical_not(valid_cells)
-all_valid_cells = valid_cells[np.newaxis, :, :]
-all_valid_cells = np.repeat(all_valid_cells, len(output["time"]), axis=0)
-all_valid_cells = all_valid_cells.transpose(0, 2, 1)
-
-# grid['cellid'].values = grid['cellid'].values.astype(int)
-
-variables = ts.columns.tolist()
-
-for variable in variables:
-    output[variable] = output["SoilC"].copy(deep=True)
-
-    variable_df = all_output.query(f'variable == "{variable}"')
-
-    # output = output.rename({'SoilC': variable})
-    output[variable].attrs["units"] = str(variable_df.unit.unique().item())
-    output[variable].attrs["long_name"] = variable_df.variable.unique().item()
-
-    # get mapping from cell to variable
-    mapping_df = variable_df.set_index(["cell", "year"])["value"].loc[
-        grid["cellid"].values[valid_cells]
-    ]
-
-    # transpose to get year as index
-    mapping_df = mapping_df.swaplevel().sort_index()
-
-    output[variable][:] = np.nan
-    out_sub = output[variable].transpose("time", "longitude", "latitude")
-
-    # replace values with those for variable of mapping
-    out_sub.values[all_valid_cells] = mapping_df.values
-    output[variable].values = out_sub.transpose(
-        "time", "latitude", "longitude"
-    ).values
-    output[variable].values = np.where(
-        output[variable].values == -1e32, np.nan, output[variable].values
+# gridded output written with output_settings.file_format: "netcdf"
+output_file = f"{output_path}/inseeds_data.nc"
+if not os.path.isfile(output_file):
+    raise FileNotFoundError(
+        f"{output_file} does not exist, the maps are plotted from the gridded"
+        ' output written with output_settings.file_format: "netcdf"'
     )
 
-
-# drop the 'variable_to_drop' variable from the 'dataset' dataset
-output = output.drop_vars("SoilC")
+# plotted variables (written with the farmer output of the configuration)
+variables = [
+    "farmer_tillage",
+    "farmer_cropyield",
+    "farmer_avg_hdate",
+    "farmer_soilc",
+]
+output = read_output(output_file, entity="Farmer")
+missing = [variable for variable in variables if variable not in output]
+if missing:
+    raise KeyError(
+        f"Variables {missing} not in {output_file}, add them to the farmer"
+        " output of the configuration"
+    )
+output = output[variables]
+output["time"] = output.time.dt.year
+for variable in variables:
+    if "units" not in output[variable].attrs:
+        output[variable].attrs["units"] = ""
 
 
 # define a colormap with two colors
 behaviour_cmap = ListedColormap(["purple", "yellow"])
 var_cmap = {
-    "agent behaviour": None,
-    "average crop yield": "YlGn",
-    "average harvest date": "winter",
-    "soil organic carbon": "YlOrBr",
+    "farmer_tillage": None,
+    "farmer_cropyield": "YlGn",
+    "farmer_avg_hdate": "winter",
+    "farmer_soilc": "YlOrBr",
 }
 
 for year in range(2023, 2051):
@@ -126,7 +84,7 @@ for year in range(2023, 2051):
         )
         axis[cc, rr].add_feature(cfeature.COASTLINE, linewidth=0.5)
 
-        if variable == "agent behaviour":
+        if variable == "farmer_tillage":
 
             # use the colormap in the plot
             im = (
@@ -154,9 +112,9 @@ for year in range(2023, 2051):
             )
         else:
             # Set vmin and vmax based on the variable
-            if variable == "average crop yield":
+            if variable == "farmer_cropyield":
                 vmin, vmax = 0, 60
-            elif variable == "soil organic carbon":
+            elif variable == "farmer_soilc":
                 vmin, vmax = 0, 6000
             else:
                 vmin, vmax = np.nanmin(output[variable].values), np.nanmax(
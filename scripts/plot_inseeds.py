@@ -1,19 +1,14 @@
 # %%
-import pandas as pd
 import matplotlib.pyplot as plt
 
+from inseeds.reader import read_output
 
 output_path = "./simulations/output/coupled_test/"
 
-all_output = pd.read_csv(f"{output_path}/inseeds.csv")
-ts = pd.pivot_table(
-    all_output, values="value", index=["year", "cell"], columns=["variable"]
-)
-
-ts.query("cell == 0")
-ts_mean = ts.groupby("year").mean()
+all_output = read_output(output_path, entity="Farmer", as_xarray=True)
+ts_mean = all_output.mean("cell").to_dataframe()
 
-ts_mean = ts_mean.drop("average harvest date", axis=1)
+ts_mean = ts_mean.drop("average harvest date", axis=1, errors="ignore")
 
 # create a figure with multiple subplots
 fig, axes = plt.subplots(
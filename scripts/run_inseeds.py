@@ -90,5 +90,9 @@ run_lpjml(
 
 model = Model(config_file=config_coupled_fn)
 
-for year in model.lpjml.get_sim_years():
-    model.update(year)
+try:
+    for year in model.lpjml.get_sim_years():
+        model.update(year)
+finally:
+    # write the output of a simulation stopped early
+    model.close_output_table()
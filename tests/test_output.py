@@ -0,0 +1,449 @@
+import os
+import sys
+import atexit
+import pickle
+import pytest
+import pyarrow as pa
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from inseeds.components.base.writer import OutputWriter
+from inseeds.models.regenerative_tillage import Farmer, Model
+from inseeds.reader import join_entities, read_output
+
+
+def init_model(test_path, tmp_path):
+    """Initialize a test model writing its output to tmp_path."""
+    with open(f"{test_path}/data/lpjml.pkl", "rb") as lpj:
+        lpjml = pickle.load(lpj)
+
+    model = Model(lpjml=lpjml, test_path=test_path)
+
+    model.config.sim_path = str(tmp_path)
+    (tmp_path / "output" / model.config.sim_name).mkdir(parents=True)
+
+    return model
+
+
+def with_year(table, year):
+    """Return the output table with the year set to `year`."""
+    return table.set_column(
+        table.schema.get_field_index("year"),
+        "year",
+        pa.array(np.full(len(table), year)),
+    )
+
+
+def test_write_output_parquet(test_path, tmp_path):
+    """Test writing the yearly files of the parquet output dataset."""
+    model = init_model(test_path, tmp_path)
+
+    output = model.get_output_table()
+    model.write_output_parquet(with_year(output, 2023), init=True)
+    model.write_output_parquet(with_year(output, 2024))
+    model.write_output_parquet(with_year(output, 2025))
+
+    directory = model.get_output_file_name("parquet")
+    assert sorted(os.listdir(directory)) == [
+        f"year={year}.parquet" for year in [2023, 2024, 2025]
+    ]
+
+    # readable before the output is closed, ignoring an interrupted write
+    with open(os.path.join(directory, ".year=2026.parquet.tmp"), "w") as tmp:
+        tmp.write("partial")
+    written = pd.read_parquet(directory)
+    assert len(written) == 3 * len(output)
+    assert list(written.columns) == output.column_names
+    assert sorted(set(written["year"])) == [2023, 2024, 2025]
+    model.close_output_table()
+
+    # reopening without init adds years without rewriting the others
+    stats = {
+        name: os.stat(os.path.join(directory, name)).st_mtime_ns
+        for name in os.listdir(directory)
+        if not name.startswith(".")
+    }
+    model.write_output_parquet(with_year(output, 2026))
+    model.close_output_table()
+    for name, mtime in stats.items():
+        assert os.stat(os.path.join(directory, name)).st_mtime_ns == mtime
+    assert len(pd.read_parquet(directory)) == 4 * len(output)
+
+    # a year written again replaces its file
+    model.write_output_parquet(with_year(output, 2026))
+    assert len(pd.read_parquet(directory)) == 4 * len(output)
+
+    # init at start of coupling overwrites the output
+    model.write_output_parquet(output, init=True)
+    model.close_output_table()
+    assert len(pd.read_parquet(directory)) == len(output)
+
+
+def test_wide_output_table(test_path, tmp_path):
+    """Test the wide output layout with one typed column per variable."""
+    model = init_model(test_path, tmp_path)
+
+    long_output = model.output_table
+    wide_output = model.get_output_table(layout="wide")
+
+    assert wide_output.num_rows == len(model.world.farmers)
+    assert wide_output.schema.field("agent tillage behaviour").type == "bool"
+    assert wide_output.schema.field("AFT ID").type == "int32"
+    assert wide_output.schema.field("soil organic carbon").type == "float"
+    assert wide_output.schema.field("country").type.value_type == "string"
+    assert wide_output.schema.field("entity").type.value_type == "string"
+    assert (
+        wide_output.schema.field("soil organic carbon").metadata[b"unit"]
+        == "gC/m²".encode()
+    )
+
+    # same values as the pivoted long layout
+    pivoted = long_output.pivot_table(
+        values="value", index="cell", columns="variable"
+    )
+    wide = wide_output.to_pandas().set_index("cell").sort_index()
+    for variable in pivoted.columns:
+        np.testing.assert_allclose(
+            wide[variable].astype(float), pivoted[variable], rtol=1e-6
+        )
+
+
+def test_background_output_writer():
+    """Test writing in the background thread and raising its errors."""
+    written = []
+    writer = OutputWriter(written.append, max_queue_size=1)
+    for year in range(2023, 2031):
+        writer.put(year)
+    writer.flush()
+    assert written == list(range(2023, 2031))
+    writer.close()
+
+    def fail(year):
+        raise OSError("disk full")
+
+    writer = OutputWriter(fail)
+    writer.put(2023)
+    with pytest.raises(RuntimeError, match="Writing output table failed"):
+        writer.close()
+
+
+def test_background_output_closed_at_exit(test_path, tmp_path, monkeypatch):
+    """Test closing the output of the background writer at exit if the
+    simulation is stopped before the output is closed."""
+    model = init_model(test_path, tmp_path)
+
+    hooks = []
+    monkeypatch.setattr(atexit, "register", hooks.append)
+    monkeypatch.setattr(atexit, "unregister", hooks.remove)
+    monkeypatch.delattr(sys, "_called_from_test")
+
+    model.write_output_table(init=True, background=True)
+    assert hooks == [model.close_output_table]
+
+    # called at exit
+    hooks[0]()
+    assert hooks == []
+    written = pd.read_parquet(model.get_output_file_name("parquet"))
+    assert len(written) == model.get_output_table().num_rows
+
+
+def test_normalized_output_table(test_path, tmp_path):
+    """Test the normalized layout and joining it with the entities table."""
+    model = init_model(test_path, tmp_path)
+
+    entities = model.get_entities_table()
+    output = model.get_output_table(layout="normalized")
+
+    assert entities.num_rows == len(model.world.farmers)
+    assert "AFT ID" in entities.column_names
+    assert output.column_names == ["year", "entity_id", "variable", "value"]
+    assert "AFT ID" not in output.column("variable").to_pylist()
+
+    # joined table holds the same values as the long layout
+    joined = join_entities(output, entities).to_pandas()
+    long_output = model.output_table
+    long_output = long_output[long_output["variable"] != "AFT ID"]
+
+    sort_columns = ["cell", "variable"]
+    joined["variable"] = joined["variable"].astype(str)
+    joined = joined.sort_values(sort_columns)
+    long_output = long_output.sort_values(sort_columns)
+    for name in ["year", "cell", "lon", "lat", "area [km2]", "value"]:
+        np.testing.assert_array_equal(joined[name], long_output[name])
+    np.testing.assert_array_equal(
+        joined["country"].astype(str), long_output["country"]
+    )
+
+
+def test_write_output_netcdf(test_path, tmp_path):
+    """Test writing farmer variables onto the LPJmL grid."""
+    model = init_model(test_path, tmp_path)
+
+    tables = model.get_output_tables(layout="wide")
+
+    # tables of entities without cell location, e.g. of the world
+    def unlocated_table(entity, values):
+        return pa.Table.from_arrays(
+            [
+                pa.array([entity] * len(values)).dictionary_encode(),
+                pa.array(values, pa.float32()),
+            ],
+            schema=pa.schema(
+                [
+                    pa.field("entity", pa.dictionary(pa.int32(), pa.string())),
+                    pa.field(
+                        "total soil organic carbon",
+                        pa.float32(),
+                        metadata={"variable": "soilc", "unit": "gC"},
+                    ),
+                ]
+            ),
+        )
+
+    tables.append(unlocated_table("World", [1.5]))
+    tables.append(unlocated_table("Region", [1.5, 2.5]))
+    model.write_output_netcdf(tables, 2023, init=True)
+    tables[-2] = unlocated_table("World", [2.5])
+    model.write_output_netcdf(tables, 2024)
+    model.close_output_table()
+
+    output = xr.open_dataset(model.get_output_file_name("nc"))
+
+    # single entities without location as time series, others skipped
+    assert output.world_soilc.dims == ("time",)
+    assert output.world_soilc.values.tolist() == [1.5, 2.5]
+    assert output.world_soilc.attrs["units"] == "gC"
+    assert "region_soilc" not in output
+
+    assert output.farmer_soilc.dims == ("time", "lat", "lon")
+    assert output.time.dt.year.values.tolist() == [2023, 2024]
+    assert output.farmer_soilc.attrs["units"] == "gC/m²"
+
+    # values of each farmer at its cell
+    for farmer in model.world.farmers:
+        soilc = output.farmer_soilc.sel(
+            time="2024",
+            lon=farmer.cell.grid.lon.item(),
+            lat=farmer.cell.grid.lat.item(),
+        )
+        assert soilc.item() == pytest.approx(farmer.soilc, rel=1e-6)
+
+    # cells without farmers are missing values
+    assert output.farmer_soilc.notnull().sum("time").max() == 2
+    assert output.farmer_soilc.isel(time=0).notnull().sum() == len(
+        model.world.farmers
+    )
+
+
+def test_output_schema(test_path, tmp_path):
+    """Test compiling the output schema once and rebuilding it on changes."""
+    model = init_model(test_path, tmp_path)
+    farmer = next(iter(model.world.farmers))
+
+    schema = Farmer.get_output_schema(model)
+    assert Farmer.get_output_schema(model) is schema
+    assert farmer.get_defined_outputs() == schema.variables
+    assert schema.names[schema.variables.index("soilc")] == (
+        "soil organic carbon"
+    )
+
+    model.config.coupled_config.output.farmer = ["tillage", "soilc"]
+    schema = Farmer.get_output_schema(model)
+    assert schema.variables == ["soilc", "tillage"]
+    assert len(model.output_table) == 2 * len(model.world.farmers)
+
+
+@pytest.mark.parametrize(
+    "file_format,layout",
+    [("parquet", "long"), ("csv", "wide"), ("parquet", "normalized")],
+)
+def test_read_output(test_path, tmp_path, file_format, layout):
+    """Test reading a selection of the output as Dataset (year, cell)."""
+    model = init_model(test_path, tmp_path)
+
+    write = getattr(model, f"write_output_{file_format}")
+    if layout == "normalized":
+        model.write_entities_table(file_format)
+    write(model.get_output_table(layout), init=True)
+    model.close_output_table()
+
+    cells = sorted(farmer.cell.cell_id for farmer in model.world.farmers)[:5]
+    dataset = read_output(
+        str(tmp_path / "output" / model.config.sim_name),
+        cells=cells,
+        variables=["soil organic carbon"],
+        as_xarray=True,
+    )
+
+    assert dict(dataset.sizes) == {"year": 1, "cell": 5}
+    assert list(dataset.data_vars) == ["soil organic carbon"]
+    assert dataset.cell.values.tolist() == cells
+    assert dataset.country.values.tolist() == ["NLD"] * 5
+    if layout == "long":
+        assert dataset["soil organic carbon"].attrs["units"] == "gC/m²"
+    for farmer in model.world.farmers:
+        if farmer.cell.cell_id in cells:
+            soilc = dataset["soil organic carbon"].sel(
+                year=2023, cell=farmer.cell.cell_id
+            )
+            assert soilc.item() == pytest.approx(farmer.soilc, rel=1e-6)
+
+
+def test_write_output_once_per_year(test_path, tmp_path):
+    """Test writing the output of each year once, the first year of the
+    coupling after the decisions of the farmers."""
+    with open(f"{test_path}/data/lpjml.pkl", "rb") as lpj:
+        lpjml = pickle.load(lpj)
+    lpjml.config.sim_path = str(tmp_path)
+    lpjml.config.coupled_config.output_settings.file_format = "csv"
+    lpjml.config.coupled_config.output_settings.compression = None
+    (tmp_path / "output" / lpjml.config.sim_name).mkdir(parents=True)
+
+    # write the output (skipped when testing)
+    class WritingModel(Model):
+        def write_output_table(self, *args, **kwargs):
+            del sys._called_from_test
+            try:
+                super().write_output_table(*args, **kwargs)
+            finally:
+                sys._called_from_test = True
+
+    model = WritingModel(lpjml=lpjml, test_path=test_path)
+    assert not os.path.exists(model.get_csv_file_name())
+
+    model.farmer_population.pbc[:] = 1
+    model.update(2023)
+    decided = model.get_output_table().to_pandas()
+    model.close_output_table()
+
+    written = pd.read_csv(model.get_csv_file_name())
+    assert not written.duplicated(["year", "cell", "variable"]).any()
+    assert set(written["year"]) == {2023}
+    np.testing.assert_allclose(
+        written.sort_values(["cell", "variable"])["value"],
+        decided.sort_values(["cell", "variable"])["value"].astype(float),
+    )
+
+
+@pytest.mark.parametrize("compression", [None, "gzip"])
+def test_write_output_csv(test_path, tmp_path, compression):
+    """Test streaming the csv output in the layout of pandas.to_csv."""
+    model = init_model(test_path, tmp_path)
+
+    output = model.get_output_table("wide")
+    model.write_output_csv(output, init=True, compression=compression)
+    model.write_output_csv(output, compression=compression)
+    model.close_output_table()
+
+    # reopening without init appends to the file
+    model.write_output_csv(output, compression=compression)
+    model.close_output_table()
+
+    file_name = model.get_csv_file_name(compression)
+    written = pa.input_stream(file_name, compression=compression).read()
+
+    expected = output.to_pandas().to_csv(index=False).splitlines(True)
+    assert written.decode() == expected[0] + "".join(expected[1:]) * 3
+
+    # extreme and float32 values are written as by pandas
+    values = [1e-05, 1e15, 1e16, 1.2345679e08, -0.0, 5e-324, np.nan, 0.1]
+    table = pa.table(
+        {
+            "float64": pa.array(values),
+            "float32": pa.array(values, pa.float32()),
+            "null": pa.array([None, 1.5] * 4),
+        }
+    )
+    model.write_output_csv(table, init=True, compression=compression)
+    model.close_output_table()
+    written = pa.input_stream(file_name, compression=compression).read()
+    assert written.decode() == table.to_pandas().to_csv(index=False)
+
+
+@pytest.mark.parametrize("file_format", ["parquet", "csv", "netcdf"])
+def test_truncate_output(test_path, tmp_path, file_format):
+    """Test removing the output of the years after a checkpoint."""
+    model = init_model(test_path, tmp_path)
+
+    kept = []
+    for year in range(2023, 2027):
+        if file_format == "netcdf":
+            model.write_output_netcdf(
+                model.get_output_tables(layout="wide"), year, init=year == 2023
+            )
+            continue
+        table = with_year(model.get_output_table(), year)
+        if year < 2025:
+            kept.append(table.to_pandas())
+        if file_format == "csv":
+            model.write_output_csv(
+                table, init=year == 2023, compression="gzip"
+            )
+        else:
+            model.write_output_parquet(table, init=year == 2023)
+    model.close_output_table()
+
+    if file_format == "parquet":
+        kept_files = [
+            model.get_output_file_name("parquet") + f"/year={year}.parquet"
+            for year in [2023, 2024]
+        ]
+        mtimes = [os.stat(name).st_mtime_ns for name in kept_files]
+
+    model.truncate_output(2025, file_format=file_format, compression="gzip")
+
+    if file_format == "netcdf":
+        output = xr.open_dataset(model.get_output_file_name("nc"))
+        assert output.time.dt.year.values.tolist() == [2023, 2024]
+        assert output.farmer_soilc.notnull().sum() == 2 * len(
+            model.world.farmers
+        )
+        output.close()
+    elif file_format == "csv":
+        file_name = model.get_csv_file_name("gzip")
+        written = pa.input_stream(file_name, compression="gzip").read()
+        assert written.decode() == pd.concat(kept).to_csv(index=False)
+    else:
+        written = pd.read_parquet(model.get_output_file_name("parquet"))
+        assert sorted(set(written["year"])) == [2023, 2024]
+        assert len(written) == 2 * model.get_output_table().num_rows
+        # the files of the kept years are not rewritten
+        assert [os.stat(name).st_mtime_ns for name in kept_files] == mtimes
+
+
+@pytest.mark.parametrize("file_format", ["parquet", "csv"])
+def test_resume_unclosed_output(test_path, tmp_path, file_format):
+    """Test resuming from a checkpoint with the output written after the
+    checkpoint never closed (e.g. killed simulation)."""
+    model = init_model(test_path, tmp_path)
+
+    def write(year):
+        table = with_year(model.get_output_table(), year)
+        if file_format == "csv":
+            # flushed only when closed
+            model.write_output_csv(table, init=year == 2023, flush_interval=0)
+        else:
+            model.write_output_parquet(table, init=year == 2023)
+
+    write(2023)
+    write(2024)
+    file_name = model.save_checkpoint(2024, str(tmp_path / "checkpoint.npz"))
+    # written after the checkpoint, the writer is not closed
+    write(2025)
+
+    with open(f"{test_path}/data/lpjml.pkl", "rb") as lpj:
+        lpjml = pickle.load(lpj)
+    lpjml.config.sim_path = str(tmp_path)
+    lpjml.config.coupled_config.output_settings.file_format = file_format
+    lpjml.config.coupled_config.output_settings.compression = None
+    resumed = Model.from_checkpoint(
+        file_name, lpjml=lpjml, test_path=test_path
+    )
+
+    if file_format == "csv":
+        written = pd.read_csv(resumed.get_csv_file_name())
+    else:
+        written = pd.read_parquet(resumed.get_output_file_name("parquet"))
+    assert sorted(set(written["year"])) == [2023, 2024]
+    assert len(written) == 2 * model.get_output_table().num_rows
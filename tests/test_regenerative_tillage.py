@@ -1,11 +1,21 @@
 import pickle
+from types import SimpleNamespace
 import pytest
 import numpy as np
 import pandas as pd
 
 import inseeds.components.base as base
 import inseeds.components.farming as farming
+from inseeds.components.farming import neighbourhood
+from inseeds.components.farming.scheduling import DecisionCalendar
+from inseeds.components.lpjml import (
+    LPJmLRecorder,
+    LPJmLReplay,
+    ReplayStore,
+    TillageResponse,
+)
 from inseeds.models.regenerative_tillage import Cell, Farmer, World, Model
+from inseeds.models.regenerative_tillage.main import run_inseeds
 
 
 def test_run_model(test_path):
@@ -59,3 +69,816 @@ def test_model_output(test_path):
             assert np.mean(output[name].values == row.values).item() > 0.75
         else:
             assert all(output[name].values == row.values)
+
+
+def test_farmer_population_update(test_path):
+    """Test the vectorized population update against updating the farmers
+    one after another in the order of their average harvest date."""
+    with open(f"{test_path}/data/lpjml.pkl", "rb") as lpj:
+        lpjml = pickle.load(lpj)
+
+    model = Model(lpjml=lpjml, test_path=test_path)
+    population = model.farmer_population
+    with_tillage = model.world.input.with_tillage.values
+
+    # adjacency matrix keeps the neighbourhoods in their order
+    for i, farmer in enumerate(population):
+        assert [population.index[n] for n in farmer.neighbourhood] == list(
+            population.neighbours(i)
+        )
+
+    rng = np.random.default_rng(0)
+    switches = 0
+    for seed in range(20):
+        # random state with many decisions and ties in the decision order
+        population.tillage[:] = rng.integers(0, 2, len(population))
+        population.strategy_switch_time[:] = rng.integers(
+            -1, 2, len(population)
+        )
+        population.soilc_previous[:] = population.soilc * rng.uniform(
+            0.5, 1.5, len(population)
+        )
+        population.cropyield_previous[:] = population.cropyield * rng.uniform(
+            0.5, 1.5, len(population)
+        )
+        population.pbc[:] = rng.uniform(0.5, 1, len(population))
+        population.avg_hdate[:] = rng.integers(100, 105, len(population))
+
+        state = {
+            name: values.copy()
+            for name, values in population.variables.items()
+        }
+        input_state = with_tillage.copy()
+
+        np.random.seed(seed)
+        population.update(2024)
+        model.set_lpjml_input()
+        vectorized = {
+            name: values.copy()
+            for name, values in population.variables.items()
+        }
+        vectorized_input = with_tillage.copy()
+
+        # reset and update each farmer (views on the population arrays)
+        for name, values in state.items():
+            population.variables[name][:] = values
+        with_tillage[:] = input_state
+
+        np.random.seed(seed)
+        for farmer in sorted(population, key=lambda farmer: farmer.avg_hdate):
+            farmer.update(2024)
+            farmer.set_lpjml(attribute="tillage")
+
+        for name, values in population.variables.items():
+            np.testing.assert_array_equal(vectorized[name], values)
+        np.testing.assert_array_equal(vectorized_input, with_tillage)
+
+        switches += np.sum(vectorized["tillage"] != state["tillage"])
+
+    assert switches > 0
+
+    # farmers are views on the population arrays
+    farmer = population.entities[0]
+    farmer.pbc = 0.3
+    assert population.pbc[0] == 0.3
+    assert isinstance(farmer.tillage, int)
+
+
+def test_set_lpjml_input(test_path):
+    """Test setting the mapped attributes of the farmers to the LPJmL input,
+    skipping attributes not initialized from a multi-valued input."""
+    with open(f"{test_path}/data/lpjml.pkl", "rb") as lpj:
+        lpjml = pickle.load(lpj)
+
+    model = Model(lpjml=lpjml, test_path=test_path)
+    population = model.farmer_population
+    world_input = model.world.input
+    world_input["residue_on_field"] = (
+        world_input.with_tillage.expand_dims(band=[0, 1], axis=1) * 0.5
+    )
+    model.coupling_map["residues"] = ["residue_on_field"]
+
+    residues = world_input.residue_on_field.values.copy()
+
+    population.tillage[:] = 1 - population.tillage
+    model.set_lpjml_input()
+
+    cells = model.world.cell_indices(
+        [farmer.cell for farmer in population], world_input
+    )
+    np.testing.assert_array_equal(
+        world_input.with_tillage.values[cells, 0], population.tillage
+    )
+    assert not hasattr(population.entities[0], "residues")
+    np.testing.assert_array_equal(
+        world_input.residue_on_field.values, residues
+    )
+
+
+def test_entity_registry(test_path):
+    """Test the registry of cells and farmers by entity type."""
+    with open(f"{test_path}/data/lpjml.pkl", "rb") as lpj:
+        lpjml = pickle.load(lpj)
+
+    model = Model(lpjml=lpjml, test_path=test_path)
+    world = model.world
+
+    # cells are registered in the order of their ids
+    cell_ids = [cell.cell_id for cell in world.registry.entities("Cell")]
+    assert cell_ids == sorted(cell.cell_id for cell in world.cells)
+
+    assert set(world.farmers) == {
+        individual
+        for individual in world.individuals
+        if individual.__class__.__name__ == "Farmer"
+    }
+    for farmer in world.farmers:
+        assert farmer.cell.farmer is farmer
+        assert list(farmer.cell.farmers) == [farmer]
+
+    # deactivated farmers are deregistered
+    farmer = next(iter(world.farmers))
+    farmer.deactivate()
+    assert farmer not in world.farmers
+    assert farmer.cell.farmer is None
+    farmer.reactivate()
+    assert farmer in world.farmers
+    assert farmer.cell.farmer is farmer
+
+    # cells are registered when created, also without farmers
+    class CellModel(Model):
+        def init_farmers(self, *args, **kwargs):
+            pass
+
+    with open(f"{test_path}/data/lpjml.pkl", "rb") as lpj:
+        lpjml = pickle.load(lpj)
+    model = CellModel(lpjml=lpjml, test_path=test_path)
+    cells = list(model.world.registry.entities("Cell"))
+    assert set(cells) == set(model.world.cells)
+    assert [cell.cell_id for cell in cells] == cell_ids
+    assert model.entity_types[Cell] == cells
+
+
+def test_cell_state(test_path):
+    """Test the cell state of all cells derived at once against the output
+    of the single cells."""
+    with open(f"{test_path}/data/lpjml.pkl", "rb") as lpj:
+        lpjml = pickle.load(lpj)
+
+    model = Model(lpjml=lpjml, test_path=test_path)
+    output = model.world.output
+
+    # cells without crops and with missing yield and soil carbon
+    rng = np.random.default_rng(0)
+    output.hdate.values[:] = rng.integers(1, 365, output.hdate.shape)
+    output.cftfrac.values[:2] = 0
+    output.harvestc.values[2:4] = 0
+    output.soilc_agr_layer.values[4:6] = 0
+    model.world.update_cell_state()
+
+    for farmer in model.world.farmers:
+        cell = farmer.cell.output
+        crop_bands = [
+            i
+            for i, band in enumerate(cell.hdate.band.values)
+            if any(crop in band for crop in model.config.cftmap)
+        ]
+        cftfrac = cell.cftfrac.isel(band=crop_bands)
+        if np.sum(cftfrac.values) == 0:
+            assert farmer.cell_avg_hdate == 365
+        else:
+            assert farmer.cell_avg_hdate == np.average(
+                cell.hdate, weights=cftfrac
+            )
+        assert farmer.cell_cropyield == (cell.harvestc.values.mean() or 1e-3)
+        assert farmer.cell_soilc == (
+            cell.soilc_agr_layer.values[0].item() or 1e-3
+        )
+
+
+def test_synchronous_decision_scheduling(test_path):
+    """Test the synchronous decision scheduling against the sequential one.
+
+    With synchronous scheduling all farmers decide from the state of their
+    neighbours in the previous year, so the decisions do not depend on the
+    decision order. Starting from
+    the same random states, both modes are expected to lead to the same
+    statistics of the decisions (share of switching farmers and mean TPB),
+    not to the same single decisions.
+    """
+    with open(f"{test_path}/data/lpjml.pkl", "rb") as lpj:
+        lpjml = pickle.load(lpj)
+
+    model = Model(lpjml=lpjml, test_path=test_path)
+    population = model.farmer_population
+    avg_hdate = model.world.cell_state["avg_hdate"]
+
+    rng = np.random.default_rng(0)
+    statistics = {"sequential": [], "synchronous": []}
+    for seed in range(50):
+        population.tillage[:] = rng.integers(0, 2, len(population))
+        population.strategy_switch_time[:] = rng.integers(
+            -1, 2, len(population)
+        )
+        population.soilc_previous[:] = population.soilc * rng.uniform(
+            0.5, 1.5, len(population)
+        )
+        population.cropyield_previous[:] = population.cropyield * rng.uniform(
+            0.5, 1.5, len(population)
+        )
+        population.pbc[:] = rng.uniform(0.5, 1, len(population))
+        state = {
+            name: values.copy()
+            for name, values in population.variables.items()
+        }
+
+        results = []
+        for scheduling, order in [
+            ("sequential", None),
+            ("synchronous", None),
+            ("synchronous", rng.permutation(len(avg_hdate))),
+        ]:
+            for name, values in state.items():
+                population.variables[name][:] = values
+            population.scheduling = scheduling
+            hdates = avg_hdate.copy()
+            if order is not None:
+                avg_hdate[:] = avg_hdate[order]
+
+            np.random.seed(seed)
+            population.update(2024)
+            avg_hdate[:] = hdates
+            results.append((population.tillage.copy(), population.tpb.copy()))
+
+            if order is None:
+                statistics[scheduling].append(
+                    [
+                        np.mean(population.tillage != state["tillage"]),
+                        np.mean(population.tpb),
+                    ]
+                )
+
+        # synchronous decisions independent of the decision order
+        for tillage, tpb in results[2:]:
+            np.testing.assert_array_equal(tillage, results[1][0])
+            np.testing.assert_array_equal(tpb, results[1][1])
+
+    sequential = np.mean(statistics["sequential"], axis=0)
+    synchronous = np.mean(statistics["synchronous"], axis=0)
+    assert sequential[0] > 0
+    np.testing.assert_allclose(synchronous, sequential, atol=0.02)
+
+
+def test_domain_decomposition(test_path):
+    """Test the update of the population split into spatial domains in
+    worker processes against the serial synchronous update."""
+    populations = []
+    for domains in [1, 3]:
+        with open(f"{test_path}/data/lpjml.pkl", "rb") as lpj:
+            lpjml = pickle.load(lpj)
+        lpjml.config.coupled_config.decision_scheduling = "synchronous"
+        lpjml.config.coupled_config.decision_domains = domains
+        lpjml.config.coupled_config.debug_aggregates = True
+
+        np.random.seed(0)
+        model = Model(lpjml=lpjml, test_path=test_path)
+        populations.append(model.farmer_population)
+
+    serial, decomposed = populations
+    assert decomposed.decomposition is not None
+    assert len(decomposed.decomposition.domains) == 3
+    # every neighbour in another domain is part of the halo
+    for domain in decomposed.decomposition.domains:
+        neighbours = np.concatenate(
+            [decomposed.neighbours(i) for i in domain.farmers]
+        )
+        np.testing.assert_array_equal(
+            np.setdiff1d(neighbours, domain.farmers), domain.halo
+        )
+
+    # random state with many decisions, same for both populations
+    rng = np.random.default_rng(0)
+    for name, values in {
+        "tillage": rng.integers(0, 2, len(serial)),
+        "strategy_switch_time": rng.integers(-1, 2, len(serial)),
+        "pbc": rng.uniform(0.5, 1, len(serial)),
+    }.items():
+        serial.variables[name][:] = values
+        decomposed.variables[name][:] = values
+
+    tillage = serial.tillage.copy()
+    for year in range(2023, 2031):
+        for population in populations:
+            population.entities[0].world.update_cell_state()
+            np.random.seed(year)
+            population.update(year)
+
+        for name, values in serial.variables.items():
+            np.testing.assert_array_equal(decomposed.variables[name], values)
+    assert np.any(serial.tillage != tillage)
+
+    # aggregates are checked in the workers
+    decomposed._tillage_neighbours += 1
+    decomposed.strategy_switch_time[:] = 0
+    with pytest.raises(RuntimeError, match="Neighbourhood aggregates"):
+        decomposed.update(2031)
+    decomposed._tillage_neighbours -= 1
+
+    # a failing domain does not block the domains waiting for it in the
+    #   exchange
+    def fail_or_exchange(domain):
+        if 0 in domain.farmers:
+            raise ValueError("Domain of farmer 0 failed")
+        own = {"soilc": decomposed.soilc[domain.farmers]}
+        return decomposed.decomposition.exchange(domain, own)
+
+    decomposed.fail_or_exchange = fail_or_exchange
+    decomposed.close()
+    decomposed.decompose(3)
+    decomposed.decomposition.start()
+    with pytest.raises(RuntimeError, match="Domain of farmer 0 failed"):
+        decomposed.decomposition.run("fail_or_exchange")
+
+    # farmers still see the state after closing the domains
+    decomposed.close()
+    farmer = decomposed.entities[0]
+    assert farmer.tillage == serial.tillage[0]
+    serial.close()
+
+
+def test_derived_tpb_memo(test_path):
+    """Test the memo of the derived TPB quantities derived once per year for
+    the output against the properties of the single farmers."""
+    with open(f"{test_path}/data/lpjml.pkl", "rb") as lpj:
+        lpjml = pickle.load(lpj)
+
+    model = Model(lpjml=lpjml, test_path=test_path)
+    population = model.farmer_population
+    population.strategy_switch_time[:] = 0
+
+    calls = []
+    tpb_quantities = population.tpb_quantities
+
+    def counted_tpb_quantities(farmers, *args):
+        calls.append(len(farmers))
+        return tpb_quantities(farmers, *args)
+
+    population.tpb_quantities = counted_tpb_quantities
+
+    for year in [2023, 2024]:
+        model.update(year)
+
+        # derived once for all farmers and reused for all quantities and
+        #   single farmers
+        calls.clear()
+        for name in population.derived_variables:
+            population.output_values(name)
+            for i, farmer in enumerate(population):
+                assert population.derived(name, i) == getattr(farmer, name)
+        assert calls == [len(population)]
+
+    # changed state is derived again once
+    calls.clear()
+    farmer = population.entities[0]
+    farmer.tillage = int(not farmer.tillage)
+    neighbour = farmer.neighbourhood[0]
+    for name in population.derived_variables:
+        assert population.derived(name, 0) == getattr(farmer, name)
+        assert population.derived(
+            name, population.index[neighbour]
+        ) == getattr(neighbour, name)
+    assert calls == [len(population)]
+
+    # output of the derived quantities from the memo
+    output = model.output_table
+    output = output[output.entity == "Farmer"].set_index(["cell", "variable"])
+    for farmer in population:
+        value = output.loc[(farmer.cell.cell_id, "social norm"), "value"]
+        assert value == farmer.social_norm
+    assert calls == [len(population)]
+
+
+def test_random_streams(test_path):
+    """Test the random streams of the farmers: draws are independent of the
+    partition of the keys, and seeded models are reproducible without the
+    global random state, for the population and for the single farmers."""
+    streams = base.RandomStreams(42)
+    keys = np.arange(1000)
+    values = streams.normal("switch_time", keys, 5, 2, counter=2023)
+    np.testing.assert_array_equal(
+        np.concatenate(
+            [
+                streams.normal("switch_time", part, 5, 2, counter=2023)
+                for part in np.array_split(keys[::-1], 7)
+            ]
+        ),
+        values[::-1],
+    )
+    assert abs(values.mean() - 5) < 0.2 and abs(values.std() - 2) < 0.2
+    # drawn by NumPy's Philox generator of the stream starting at the counter
+    #   of the key and year
+    generator = np.random.Generator(
+        np.random.Philox(
+            key=streams.stream_key("switch_time"),
+            counter=np.array([0, 2023, keys[7], 0], dtype=np.uint64),
+        )
+    )
+    assert values[7] == generator.normal(5, 2)
+    integers = streams.integers("initial_switch_time", keys, 0, 10)
+    assert integers.min() == 0 and integers.max() == 9
+    assert not np.array_equal(
+        values, streams.normal("switch_time", keys, 5, 2, counter=2024)
+    )
+    assert not np.array_equal(
+        values, base.RandomStreams(43).normal("switch_time", keys, 5, 2, 2023)
+    )
+
+    populations = []
+    for domains in [1, 3]:
+        with open(f"{test_path}/data/lpjml.pkl", "rb") as lpj:
+            lpjml = pickle.load(lpj)
+        lpjml.config.coupled_config.seed = 42
+        lpjml.config.coupled_config.decision_scheduling = "synchronous"
+        lpjml.config.coupled_config.decision_domains = domains
+        lpjml.config.coupled_config.debug_aggregates = True
+
+        # the global random state is not used
+        np.random.seed(domains)
+        model = Model(lpjml=lpjml, test_path=test_path)
+        populations.append(model.farmer_population)
+
+    serial, decomposed = populations
+    for name, values in serial.variables.items():
+        np.testing.assert_array_equal(decomposed.variables[name], values)
+
+    # random state with many switches, same for both populations
+    rng = np.random.default_rng(0)
+    for name, values in {
+        "tillage": rng.integers(0, 2, len(serial)),
+        "strategy_switch_time": rng.integers(-1, 1, len(serial)),
+        "pbc": np.ones(len(serial)),
+    }.items():
+        serial.variables[name][:] = values
+        decomposed.variables[name][:] = values
+    state = {name: values.copy() for name, values in serial.variables.items()}
+
+    for seed, population in enumerate(populations):
+        population.entities[0].world.update_cell_state()
+        np.random.seed(seed)
+        population.update(2024)
+    for name, values in serial.variables.items():
+        np.testing.assert_array_equal(decomposed.variables[name], values)
+    decomposed.close()
+
+    # single farmers draw the same switch times as the population
+    switched = np.flatnonzero(serial.tillage != state["tillage"])
+    assert len(switched) > 0
+    np.testing.assert_array_equal(
+        [serial.entities[i].draw_switch_time(2024) for i in switched[::-1]],
+        serial.strategy_switch_time[switched[::-1]],
+    )
+    serial.close()
+
+
+def test_aft_parameters(test_path):
+    """Test the AFT parameter table the farmers resolve their parameters
+    through instead of holding copies of the configuration."""
+    with open(f"{test_path}/data/lpjml.pkl", "rb") as lpj:
+        lpjml = pickle.load(lpj)
+
+    model = Model(lpjml=lpjml, test_path=test_path)
+    table = model.aft_parameters
+    aftpar = model.config.coupled_config.aftpar
+    for aft in farming.farmer.AFT:
+        for name, value in getattr(aftpar, aft.name).to_dict().items():
+            assert table[aft.value][name] == value
+
+    population = model.farmer_population
+    aft_ids = [farmer.aft_id for farmer in population]
+    for name in [
+        "weight_attitude",
+        "weight_yield",
+        "strategy_switch_duration",
+    ]:
+        np.testing.assert_array_equal(
+            population.variables[name], table[name][aft_ids]
+        )
+    farmer = population.entities[0]
+    assert "weight_norm" not in farmer.__dict__
+    assert farmer.weight_norm == table[farmer.aft_id]["weight_norm"]
+
+
+def test_neighbourhood(test_path, tmp_path):
+    """Test the neighbourhoods of the spatial index against the great-circle
+    distances of all cells, their cache and their use by the farmers."""
+    with open(f"{test_path}/data/lpjml.pkl", "rb") as lpj:
+        lpjml = pickle.load(lpj)
+    lon, lat = lpjml.grid.lon.values, lpjml.grid.lat.values
+    distance = neighbourhood.great_circle_distance(
+        lon[:, None], lat[:, None], lon[None, :], lat[None, :]
+    )
+    np.fill_diagonal(distance, np.inf)
+
+    adjacency = neighbourhood.neighbourhood_adjacency(lon, lat, radius=60)
+    np.testing.assert_array_equal(adjacency.toarray() > 0, distance <= 60)
+
+    nearest = neighbourhood.neighbourhood_adjacency(lon, lat, k=3)
+    for i in range(len(lon)):
+        start, end = nearest.indptr[i], nearest.indptr[i + 1]
+        np.testing.assert_allclose(
+            distance[i, nearest.indices[start:end]], np.sort(distance[i])[:3]
+        )
+
+    country = np.where(lon < 5, "BEL", "NLD")
+    restricted = neighbourhood.neighbourhood_adjacency(
+        lon, lat, radius=60, country=country
+    )
+    np.testing.assert_array_equal(
+        restricted.toarray() > 0,
+        (distance <= 60) & (country[:, None] == country[None, :]),
+    )
+
+    # cached per grid and parameters
+    cached = neighbourhood.build_neighbourhood(
+        lon, lat, radius=60, cache_dir=tmp_path
+    )
+    assert len(list(tmp_path.iterdir())) == 1
+    for adjacency_cached in [
+        cached,
+        neighbourhood.build_neighbourhood(
+            lon, lat, radius=60, cache_dir=tmp_path
+        ),
+    ]:
+        assert (adjacency_cached != adjacency).nnz == 0
+    neighbourhood.build_neighbourhood(lon, lat, k=3, cache_dir=tmp_path)
+    assert len(list(tmp_path.iterdir())) == 2
+
+    # farmers of the cells within the radius
+    lpjml.config.coupled_config.neighbourhood = SimpleNamespace(
+        radius=60, cache_dir=str(tmp_path)
+    )
+    model = Model(lpjml=lpjml, test_path=test_path)
+    grid_index = {
+        cell_id: i for i, cell_id in enumerate(lpjml.grid.cell.values)
+    }
+    for farmer in model.world.farmers:
+        i = grid_index[farmer.cell.cell_id]
+        assert {
+            grid_index[neighbour.cell.cell_id]
+            for neighbour in farmer.neighbourhood
+        } <= set(np.flatnonzero(distance[i] <= 60))
+
+
+def test_bulk_farmer_initialization(test_path):
+    """Test the initial state of the farmers derived at once against the
+    initialization of single farmers (with the same random streams)."""
+    with open(f"{test_path}/data/lpjml.pkl", "rb") as lpj:
+        lpjml = pickle.load(lpj)
+    lpjml.config.coupled_config.seed = 42
+
+    model = Model(lpjml=lpjml, test_path=test_path)
+    population = model.farmer_population
+    farmer_cells = {farmer.cell for farmer in population}
+    assert farmer_cells == {
+        cell for cell in model.world.cells if cell.output.cftfrac.sum() > 0
+    }
+
+    for farmer in population:
+        single = Farmer(cell=farmer.cell, model=model)
+        for name in [
+            "cell_index",
+            "aft_id",
+            "tillage",
+            "avg_hdate",
+            "soilc",
+            "cropyield",
+            "strategy_switch_time",
+            "pbc",
+            "weight_norm",
+        ]:
+            assert getattr(single, name) == getattr(farmer, name), name
+        assert type(single.tillage) is type(farmer.tillage)
+        single.deactivate()
+    assert len(model.world.farmers) == len(population)
+    population.close()
+
+
+def test_decision_calendar(test_path):
+    """Test the calendar of the decisions kept over many years against
+    finding the deciding farmers from their counters each year."""
+    populations = []
+    for _ in range(2):
+        with open(f"{test_path}/data/lpjml.pkl", "rb") as lpj:
+            lpjml = pickle.load(lpj)
+        lpjml.config.coupled_config.seed = 42
+        model = Model(lpjml=lpjml, test_path=test_path)
+        populations.append(model.farmer_population)
+    calendar, counters = populations
+
+    rng = np.random.default_rng(0)
+    for name, values in {
+        "strategy_switch_time": rng.uniform(-1, 3, len(calendar)),
+        "pbc": rng.uniform(0.5, 1, len(calendar)),
+    }.items():
+        calendar.variables[name][:] = values
+        counters.variables[name][:] = values
+
+    switches = 0
+    for year in range(2024, 2054):
+        tillage = calendar.tillage.copy()
+        calendar.update(year)
+        if year == 2024:
+            scheduled = calendar.calendar
+        # reschedule from the counters each year
+        counters._scheduled = None
+        counters.update(year)
+
+        for name, values in counters.variables.items():
+            np.testing.assert_array_equal(calendar.variables[name], values)
+        switches += np.sum(calendar.tillage != tillage)
+    assert switches > 0
+    assert calendar.calendar is scheduled
+    assert len(scheduled) == len(calendar)
+
+    bucket = DecisionCalendar()
+    bucket.schedule([3, 1, 2], [2025, 2024, 2025])
+    np.testing.assert_array_equal(bucket.due(2024), [1])
+    bucket.schedule([0], [2023])
+    np.testing.assert_array_equal(bucket.due(2025), [0, 2, 3])
+    assert len(bucket) == 0
+
+
+def test_neighbourhood_aggregates(test_path):
+    """Test the incrementally updated number of neighbours using tillage
+    (cross-checked in debug mode) against counting them."""
+    with open(f"{test_path}/data/lpjml.pkl", "rb") as lpj:
+        lpjml = pickle.load(lpj)
+    lpjml.config.coupled_config.seed = 42
+    lpjml.config.coupled_config.debug_aggregates = True
+
+    model = Model(lpjml=lpjml, test_path=test_path)
+    population = model.farmer_population
+    assert population.check_aggregates
+
+    rng = np.random.default_rng(0)
+    population.strategy_switch_time[:] = rng.uniform(-1, 3, len(population))
+    population.pbc[:] = 1
+
+    switches = 0
+    for year in range(2024, 2044):
+        tillage = population.tillage.copy()
+        population.update(year)
+        switches += np.sum(population.tillage != tillage)
+        np.testing.assert_array_equal(
+            population._tillage_neighbours,
+            [
+                sum(neighbour.tillage for neighbour in farmer.neighbourhood)
+                for farmer in population
+            ],
+        )
+    assert switches > 0
+
+    # inconsistent aggregates are detected
+    population._tillage_neighbours += 1
+    population.strategy_switch_time[:] = 0
+    with pytest.raises(RuntimeError):
+        population.update(2044)
+
+
+def test_checkpoint(test_path, tmp_path):
+    """Test resuming the model from a checkpoint against the continued
+    simulation."""
+    with open(f"{test_path}/data/lpjml.pkl", "rb") as lpj:
+        lpjml = pickle.load(lpj)
+
+    np.random.seed(0)
+    model = Model(lpjml=lpjml, test_path=test_path)
+    population = model.farmer_population
+    population.pbc[:] = 1
+    for year in range(2023, 2026):
+        model.update(year)
+    file_name = model.save_checkpoint(2025, str(tmp_path / "checkpoint.npz"))
+
+    continued = []
+    for year in range(2026, 2031):
+        model.update(year)
+        continued.append(
+            {
+                name: values.copy()
+                for name, values in population.variables.items()
+            }
+        )
+
+    with open(f"{test_path}/data/lpjml.pkl", "rb") as lpj:
+        lpjml = pickle.load(lpj)
+    np.random.seed(1)
+    resumed = Model.from_checkpoint(
+        file_name, lpjml=lpjml, test_path=test_path
+    )
+    assert resumed.resumed_year == 2025
+    assert [farmer.cell.cell_id for farmer in resumed.farmer_population] == [
+        farmer.cell.cell_id for farmer in population
+    ]
+    assert [
+        [n.cell.cell_id for n in farmer.neighbourhood]
+        for farmer in resumed.farmer_population
+    ] == [
+        [n.cell.cell_id for n in farmer.neighbourhood] for farmer in population
+    ]
+
+    # entities keep their ids in the output
+    assert [farmer.entity_id for farmer in resumed.farmer_population] == [
+        farmer.entity_id for farmer in population
+    ]
+    assert [
+        cell.entity_id for cell in resumed.world.registry.entities("Cell")
+    ] == [cell.entity_id for cell in model.world.registry.entities("Cell")]
+    assert resumed.world.entity_id == model.world.entity_id
+
+    for year, variables in zip(range(2026, 2031), continued):
+        resumed.update(year)
+        for name, values in variables.items():
+            np.testing.assert_array_equal(
+                resumed.farmer_population.variables[name], values
+            )
+    # farmers decided after the checkpoint
+    assert np.any(continued[-1]["tpb"] != 0)
+
+
+def test_replay(test_path, tmp_path):
+    """Test recording the LPJmL coupling and running the model from the
+    replayed outputs."""
+    with open(f"{test_path}/data/lpjml.pkl", "rb") as lpj:
+        lpjml = pickle.load(lpj)
+    with open(f"{test_path}/data/lpjml_input.pkl", "rb") as inp:
+        lpjml_input = pickle.load(inp)
+    with open(f"{test_path}/data/lpjml_output.pkl", "rb") as out:
+        lpjml_output = pickle.load(out)
+
+    # record a coupling with yields increasing by year
+    recorder = LPJmLRecorder(lpjml, tmp_path / "store")
+
+    def read_output(year, to_xarray=True):
+        output = lpjml_output.copy(deep=True)
+        output.harvestc.values[:] *= 1 + (year - 2022) / 10
+        return output
+
+    lpjml.read_input = lambda: lpjml_input
+    lpjml.read_historic_output = lambda: lpjml_output
+    lpjml.read_output = read_output
+    lpjml.send_input = lambda input_dict, year: None
+    recorder.read_input()
+    recorder.read_historic_output()
+    for year in range(2023, 2031):
+        recorder.send_input(lpjml_input, year)
+        recorder.read_output(year)
+
+    store = ReplayStore(tmp_path / "store")
+    assert store.years == list(range(2023, 2031))
+
+    model = Model(replay=str(tmp_path / "store"), test_path=test_path)
+    assert isinstance(model.lpjml, LPJmLReplay)
+    assert model.lpjml.sim_years == list(range(2023, 2031))
+    harvestc = lpjml_output.harvestc.values
+    for year in model.lpjml.get_sim_years():
+        model.update(year)
+        np.testing.assert_array_equal(
+            model.world.output.harvestc.values,
+            harvestc * (1 + (year - 2022) / 10),
+        )
+        assert model.lpjml.sim_year == year + 1
+
+    # tillage response to the sent input differing from the recorded one
+    response = TillageResponse(yield_change=-0.1, soilc_change=0.01)
+    replay = LPJmLReplay(store, response=response)
+    # input name from the recorded coupling map
+    assert response.input_name == "with_tillage"
+    replay.read_historic_output()
+    sent_input = lpjml_input.copy(deep=True)
+    sent_input.with_tillage.values[:2] = 0
+    recorded = lpjml_input.with_tillage.values[:, 0] == 1
+    changed = recorded & (np.arange(len(recorded)) < 2)
+    assert changed.any()
+    for year in [2023, 2024]:
+        replay.send_input(sent_input, year)
+        output = replay.read_output(year)
+        expected = store.read_year("output", year)
+        np.testing.assert_allclose(
+            output.harvestc.values[changed],
+            0.9 * expected["harvestc"][changed],
+        )
+        np.testing.assert_array_equal(
+            output.harvestc.values[~changed], expected["harvestc"][~changed]
+        )
+    # soil carbon accumulates the response over the years
+    np.testing.assert_allclose(
+        output.soilc_agr_layer.values[changed],
+        1.02 * expected["soilc_agr_layer"][changed],
+    )
+    np.testing.assert_array_equal(
+        output.soilc_agr_layer.values[~changed],
+        expected["soilc_agr_layer"][~changed],
+    )
+
+    # replay with the tillage response from the command line options
+    run_inseeds(replay=str(tmp_path / "store"), yield_change=-0.1)